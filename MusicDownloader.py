@@ -1,57 +1,389 @@
 import argparse
-import ctypes
+import asyncio
+import base64
+import contextvars
+import hashlib
+import hmac
 import io
+import itertools
+import json
+import math
 import os
+import random
 import re
 import sys
-import requests
 import shutil
+import sqlite3
 import subprocess
 import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
+from collections import deque
+from contextlib import aclosing, contextmanager, asynccontextmanager
 from pathlib import Path
-from mutagen.mp3 import MP3
-from mutagen.id3 import TIT2, TPE1, TPE2, TALB, TDRC, TRCK, APIC, TYER
-from ytmusicapi import YTMusic
-from PIL import Image
+from urllib.parse import urlparse
 
-from PySide6.QtWidgets import (QApplication, QWidget, QLabel, QLineEdit, QPushButton, QVBoxLayout, QFormLayout, QHBoxLayout, QTextEdit, QFileDialog, QSpinBox)
-from PySide6.QtGui import QPixmap, QFont, QIcon
-from PySide6.QtCore import Qt, QThread, Signal
+# requests, mutagen, PIL, ytmusicapi, yt-dlp and the Qt stack are imported where they are first used, so a headless
+# run only pays for what it touches and the gui (gui.py) is never loaded from the command line
 
-yt = YTMusic()
 log_lock = threading.Lock()
 
-file_lock = threading.Lock()
-playlist_write_index = 0
+engine_lock = threading.Lock()
+download_engines = {}
+
+http_lock = threading.Lock()
+http_session = None
+http_counters = {"retries": 0}
+# the telemetry of the job whose task (or to_thread worker) is making the request, so retries are charged per job
+http_telemetry = contextvars.ContextVar("http_telemetry", default=None)
+yt_clients = threading.local()
+
+scheduler_lock = threading.Lock()
+scheduler = None
+bandwidth = None
+
+cache_lock = threading.Lock()
+metadata_caches = {}
+cover_caches = {}
+library_indexes = {}
+playlist_snapshots = {}
+
+WATCH_URL = "https://www.youtube.com/watch?v={}"
+METADATA_HOST = "music.youtube.com"
+SOURCE_BYTES_PER_SECOND = 160 * 1000 // 8 # typical youtube music audio stream
+REQUESTS_PER_DOWNLOAD = 4 # webpage, player api, player js, media
+VIDEO_ID_TAG = "YTMUSIC_VIDEOID"
+AUDIO_EXTENSIONS = {".mp3", ".m4a", ".opus", ".ogg"}
+AUDIO_FORMATS = {
+    # output mode: (yt-dlp format selector, preferred output extension)
+    "mp3": ('ba[acodec^=mp3]/ba/b', ".mp3"),
+    "native": ('ba[acodec=opus]/ba[acodec^=mp4a]/ba/b', ".opus"),
+}
+REMUX_EXTENSIONS = {".webm": ".opus", ".opus": ".opus", ".ogg": ".ogg", ".m4a": ".m4a", ".mp4": ".m4a", ".mp3": ".mp3"}
+PROGRESS_PREFIX = "progress "
+THROTTLE_ERRORS = re.compile(r'429|too many requests|rate.?limit|throttl', re.IGNORECASE)
+
+LOG_DEBUG, LOG_INFO, LOG_WARNING, LOG_ERROR = 10, 20, 30, 40
+LOG_LEVELS = {"debug": LOG_DEBUG, "info": LOG_INFO, "warning": LOG_WARNING, "error": LOG_ERROR}
 
 class Logger():
-    def __init__(self, logger = print):
+    def __init__(self, logger = print, level = LOG_DEBUG):
         self.logger = logger
+        self.level = level
     
-    def out(self, s : str):
-        if self.logger:
+    def out(self, s : str, level = LOG_INFO):
+        if self.logger and level >= self.level:
             with log_lock: 
                 self.logger(s)
 
-def start_timer():
-    global start_time, end_time
-    start_time = time.time()
-    end_time = 0
+    def enabled(self, level = LOG_INFO):
+        return bool(self.logger) and level >= self.level
+
+class LogBuffer(Logger):
+    # lock-free sink for the gui: writers only append to a bounded deque (atomic in CPython) and the gui drains it on a
+    # timer, appending each batch in one go, so logging costs the same however many workers are running
+    def __init__(self, max_lines = 5000, level = LOG_INFO):
+        super().__init__(None, level)
+        self.lines = deque(maxlen=max_lines)
+        self.appended = 0
+
+    def out(self, s : str, level = LOG_INFO):
+        if level < self.level: return
+        self.lines.append(s)
+        self.appended += 1
+
+    def enabled(self, level = LOG_INFO):
+        return level >= self.level
+
+    def drain(self):
+        # returns the buffered lines and (roughly) how many fell off the end of the ring since the last drain
+        lines = []
+        while True:
+            try: lines.append(self.lines.popleft())
+            except IndexError: break
+        appended, self.appended = self.appended, 0
+        return lines, max(0, appended - len(lines))
+
+    def clear(self):
+        self.drain()
+
+def parse_log_level(name, default = LOG_INFO):
+    return LOG_LEVELS.get(str(name).strip().lower(), default)
+
+def percentile(values, p):
+    if not values: return 0.0
+    ordered = sorted(values)
+    # nearest rank: the smallest value with at least p% of the samples at or below it
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p * len(ordered) / 100.0) - 1))]
+
+def pin_mmap_threshold():
+    # glibc raises its mmap threshold to the largest block freed so far, after which every cover sized buffer (tagging
+    # copies the cover a few times per track) comes out of the per thread heaps and fragments them, so a long playlist
+    # grows the process by megabytes. a fixed threshold keeps those buffers mmapped and hands them back when freed
+    if not sys.platform.startswith("linux"): return
+    try:
+        import ctypes
+        ctypes.CDLL(None).mallopt(-3, 128 * 1024) # M_MMAP_THRESHOLD
+    except (OSError, AttributeError):
+        pass
 
-def stop_timer(logger : Logger = Logger()):
-    global start_time, end_time, delta_time
-    end_time = time.time()
-    delta_time = end_time - start_time
-    logger.out(f"Stopped after {int(delta_time / 60.0)} minutes and {int(delta_time % 60)} seconds")
+class Metrics():
+    # process wide aggregate of every job's telemetry, kept for the prometheus endpoint; samples are a bounded
+    # window so a long running batch doesn't grow without limit
+    def __init__(self, window = 2000):
+        self.lock = threading.Lock()
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+        self.sums = {}
+        self.counters = {}
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            samples = self.samples.setdefault(stage, [])
+            samples.append(seconds)
+            if len(samples) > self.window: del samples[:len(samples) - self.window]
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+            self.sums[stage] = self.sums.get(stage, 0.0) + seconds
+
+    def count(self, name, n = 1):
+        with self.lock: self.counters[name] = self.counters.get(name, 0) + n
+
+    def prometheus(self):
+        lines = ["# TYPE musicdownloader_stage_seconds summary"]
+        with self.lock:
+            for stage, samples in sorted(self.samples.items()):
+                for q in [0.5, 0.95, 0.99]:
+                    lines.append(f'musicdownloader_stage_seconds{{stage="{stage}",quantile="{q}"}} {percentile(samples, q * 100):.6f}')
+                lines.append(f'musicdownloader_stage_seconds_sum{{stage="{stage}"}} {self.sums[stage]:.6f}')
+                lines.append(f'musicdownloader_stage_seconds_count{{stage="{stage}"}} {self.counts[stage]}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE musicdownloader_{name}_total counter")
+                lines.append(f"musicdownloader_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+class Telemetry():
+    # per job timings and counters; every record also goes to the json lines trace (if enabled) and the process metrics.
+    # percentiles come from a uniform sample of at most `samples` timings per stage, so a huge playlist's summary costs
+    # no more memory than an album's; counts and totals are exact
+    def __init__(self, job = "", trace_dir = None, samples = 1000):
+        self.job = job
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+        self.samples = samples
+        self.durations = {}
+        self.counts = {}
+        self.totals = {}
+        self.counters = {}
+        self.trace = None
+        if trace_dir:
+            Path(trace_dir).mkdir(parents=True, exist_ok=True)
+            self.trace = open(Path(trace_dir) / f"{time.strftime('%Y%m%d-%H%M%S')}-{sanitise(job)[:60]}.jsonl", "a", encoding="utf-8")
+
+    def record(self, stage, seconds, track = None, **extra):
+        metrics.observe(stage, seconds)
+        with self.lock:
+            count = self.counts[stage] = self.counts.get(stage, 0) + 1
+            self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+            values = self.durations.setdefault(stage, [])
+            if len(values) < self.samples: values.append(seconds)
+            else:
+                i = random.randrange(count)
+                if i < self.samples: values[i] = seconds
+            if self.trace:
+                self.trace.write(json.dumps({"time": time.time(), "job": self.job, "track": track, "stage": stage, "seconds": round(seconds, 6), **extra}) + "\n")
+
+    @contextmanager
+    def span(self, stage, track = None, **extra):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, track, **extra)
+
+    def count(self, name, n = 1):
+        metrics.count(name, n)
+        with self.lock: self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        with self.lock:
+            return {stage: {
+                "count": self.counts[stage],
+                "total": self.totals[stage],
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+            } for stage, values in self.durations.items()}
+
+    def close(self, logger : Logger = Logger()):
+        elapsed = time.time() - self.start_time
+        summary = self.summary()
+        logger.out(f"Stopped after {int(elapsed / 60.0)} minutes and {int(elapsed % 60)} seconds")
+        for stage, s in summary.items():
+            logger.out(f"   {stage:<16} n={s['count']:<5} p50={s['p50']:.2f}s p95={s['p95']:.2f}s p99={s['p99']:.2f}s total={s['total']:.1f}s")
+        if self.counters:
+            logger.out("   " + ", ".join(f"{name}={value}" for name, value in sorted(self.counters.items())))
+        with self.lock:
+            if self.trace:
+                self.trace.write(json.dumps({"time": time.time(), "job": self.job, "summary": summary, "counters": self.counters, "seconds": elapsed}) + "\n")
+                self.trace.close()
+                self.trace = None
+
+def new_telemetry(data, config):
+    return Telemetry(f"{data['artist']} - {data['title']}" if data else "", config.get("trace_dir"))
+
+class JobControl():
+    # pause flag and byte progress for everything one worker runs. engines report progress from their own threads as
+    # often as yt-dlp does; it goes out to on_progress at most every `interval` seconds, aggregated per track, album and overall.
+    # cancelling is plain task cancellation, this only decides whether new work may start
+    def __init__(self, on_progress = None, interval = 0.25):
+        self.lock = threading.Lock()
+        self.resumed = threading.Event()
+        self.resumed.set()
+        self.on_progress = on_progress
+        self.interval = interval
+        self.last_emit = 0.0
+        self.ids = itertools.count()
+        self.tracks = {}
+        self.keys = {}
+
+    def pause(self):
+        self.resumed.clear()
+
+    def resume(self):
+        self.resumed.set()
+
+    @property
+    def paused(self):
+        return not self.resumed.is_set()
+
+    async def wait(self):
+        while not self.resumed.is_set(): await asyncio.sleep(0.2)
+
+    def add(self, job):
+        # until yt-dlp reports the real size, a track counts as its duration at a typical stream bitrate. a track can be
+        # added ahead of its job (see Pipeline.expect), the job then takes over the same entry
+        track, data = job["track"], job["data"]
+        album = f"{data['artist']} - {data['title']}"
+        with self.lock:
+            progress_id = self.keys.get((album, track["videoId"]))
+            if progress_id is None:
+                progress_id = self.keys[(album, track["videoId"])] = next(self.ids)
+                self.tracks[progress_id] = [album, track["title"], 0, (track.get("duration_seconds") or 0) * SOURCE_BYTES_PER_SECOND, False]
+        job["progress_id"] = progress_id
+
+    def update(self, job, downloaded, total = None):
+        with self.lock:
+            entry = self.tracks.get(job.get("progress_id"))
+            if entry is None: return
+            entry[2] = downloaded or 0
+            if total: entry[3] = total
+        self.changed()
+
+    def finish(self, job):
+        with self.lock:
+            entry = self.tracks.get(job.get("progress_id"))
+            if entry is None: return
+            entry[2] = entry[3] = max(entry[2], entry[3])
+            entry[4] = True
+            last = all(entry[4] for entry in self.tracks.values())
+        self.changed(force=last)
+
+    def snapshot(self):
+        with self.lock:
+            albums = {}
+            for album, title, done, total, finished in self.tracks.values():
+                a = albums.setdefault(album, {"done_bytes": 0, "total_bytes": 0, "tracks_done": 0, "tracks": 0})
+                a["done_bytes"] += done
+                a["total_bytes"] += total
+                a["tracks_done"] += finished
+                a["tracks"] += 1
+            active = [{"album": album, "title": title, "done_bytes": done, "total_bytes": total} for album, title, done, total, finished in self.tracks.values() if done and not finished]
+        return {
+            "done_bytes": sum(a["done_bytes"] for a in albums.values()),
+            "total_bytes": sum(a["total_bytes"] for a in albums.values()),
+            "tracks_done": sum(a["tracks_done"] for a in albums.values()),
+            "tracks": sum(a["tracks"] for a in albums.values()),
+            "albums": albums,
+            "active": active,
+            "paused": self.paused,
+        }
+
+    def changed(self, force = False):
+        if not self.on_progress: return
+        now = time.monotonic()
+        with self.lock:
+            if not force and now - self.last_emit < self.interval: return
+            self.last_emit = now
+        self.on_progress(self.snapshot())
+
+def format_progress(snapshot):
+    mb = 1024 * 1024
+    text = f"{snapshot['tracks_done']}/{snapshot['tracks']} tracks, {snapshot['done_bytes'] / mb:.1f}/{snapshot['total_bytes'] / mb:.1f} MB"
+    if snapshot["active"]: text += f", {len(snapshot['active'])} downloading"
+    if snapshot["paused"]: text += " (paused)"
+    return text
+
+def start_metrics_server(port, logger : Logger = Logger()):
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.out(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+    return server
 
 def load_config():
     settings = {
         "out_dir": os.path.join(os.getcwd(), "out"),
         "temp_dir": os.path.join(os.getcwd(), "temp"),
         "cover_dir": os.path.join(os.getcwd(), "covers"),
+        "yt_dlp_path": os.path.join(os.getcwd(), "yt-dlp.exe"),
+        "ffmpeg_dir": os.getcwd(),
+        "engine": "library",
+        "audio_format": "mp3",
+        "watch_url": WATCH_URL,
+        "cache_dir": os.path.join(os.getcwd(), "cache"),
+        "cache_ttl": 30 * 24 * 3600,
+        "playlist_cache_ttl": 3600,
+        "cache_max_entries": 5000,
+        "cache_only": False,
+        "http_timeout": 20,
+        "http_retries": 5,
+        "http_pool_size": 32,
+        "host_rate_limits": "music.youtube.com=5",
+        "playlist_format": "pls",
+        "library_mode": "hardlink",
+        "trace_dir": "",
+        "batch_jobs": 2,
+        "prefetch_jobs": 4,
+        "log_level": "info",
+        "rate_limit": "0",
+        "job_rate_limit": "0",
+        "track_rate_limit": "0",
+        "rate_schedule": "",
+        "console_max_lines": 5000,
+        "daemon_port": 8765,
+        "gui_daemon": True,
+        "playlist_sync": False,
+        "sync_prune": "keep",
         "starting_index": 0,
         "max_threads": 32
     }
@@ -62,39 +394,450 @@ def load_config():
             config = ConfigParser()
             config.read(config_path)
             if 'Settings' in config:
-                if 'out_dir' in config['Settings']:
-                    settings['out_dir'] = config['Settings']['out_dir'].strip('"').strip("'")
-                if 'cover_dir' in config['Settings']:
-                    settings['cover_dir'] = config['Settings']['cover_dir'].strip('"').strip("'")
-                if 'temp_dir' in config['Settings']:
-                    settings['temp_dir'] = config['Settings']['temp_dir'].strip('"').strip("'")
+                for key in ["out_dir", "cover_dir", "temp_dir", "yt_dlp_path", "ffmpeg_dir", "engine", "audio_format", "cache_dir", "host_rate_limits", "playlist_format", "library_mode", "trace_dir", "log_level", "rate_limit", "job_rate_limit", "track_rate_limit", "rate_schedule", "sync_prune"]:
+                    if key in config['Settings']:
+                        settings[key] = config['Settings'][key].strip('"').strip("'")
+                for key in ["max_threads", "cache_ttl", "playlist_cache_ttl", "cache_max_entries", "http_timeout", "http_retries", "http_pool_size", "batch_jobs", "prefetch_jobs", "console_max_lines", "daemon_port"]:
+                    if key in config['Settings']:
+                        settings[key] = config['Settings'].getint(key)
+                for key in ["cache_only", "playlist_sync", "gui_daemon"]:
+                    if key in config['Settings']:
+                        settings[key] = config['Settings'].getboolean(key)
         except Exception as e:
             print(f"Config Error: {e}")
     return settings
 
-def scrape_data(url : str = "", logger : Logger = Logger(), album_id = None):
+def new_http_adapter(config):
+    import requests.adapters
+    import urllib3.util.retry
+
+    class CountingRetry(urllib3.util.retry.Retry):
+        def increment(self, *args, **kwargs):
+            with http_lock: http_counters["retries"] += 1
+            telemetry = http_telemetry.get()
+            if telemetry: telemetry.count("http_retries")
+            return super().increment(*args, **kwargs)
+
+    class TimeoutHTTPAdapter(requests.adapters.HTTPAdapter):
+        def __init__(self, timeout, *args, **kwargs):
+            self.timeout = timeout
+            super().__init__(*args, **kwargs)
+
+        def send(self, request, **kwargs):
+            if kwargs.get("timeout") is None: kwargs["timeout"] = self.timeout
+            return super().send(request, **kwargs)
+
+    retry = CountingRetry(
+        total=config["http_retries"],
+        backoff_factor=0.5,
+        backoff_jitter=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=None,
+        raise_on_status=False,
+    )
+    return TimeoutHTTPAdapter(config["http_timeout"], pool_connections=8, pool_maxsize=config["http_pool_size"], max_retries=retry)
+
+def get_http_session(config):
+    # one pooled session for everything that isn't yt-dlp: covers and every YTMusic client
+    global http_session
+    with http_lock:
+        if http_session is None:
+            import requests
+            adapter = new_http_adapter(config)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            http_session = session
+        return http_session
+
+def get_http_stats():
+    stats = {"requests": 0, "connections": 0, "reused": 0, "retries": http_counters["retries"]}
+    if http_session is None: return stats
+    for adapter in set(http_session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None: continue
+            stats["requests"] += pool.num_requests
+            stats["connections"] += pool.num_connections
+    stats["reused"] = max(0, stats["requests"] - stats["connections"])
+    return stats
+
+def log_http_stats(logger : Logger = Logger()):
+    stats = get_http_stats()
+    logger.out(f"HTTP: {stats['requests']} requests over {stats['connections']} connections ({stats['reused']} reused), {stats['retries']} retries")
+
+def get_yt(config):
+    # YTMusic keeps per-request state, so each thread gets its own client on the shared session
+    client = getattr(yt_clients, "yt", None)
+    if client is None:
+        from ytmusicapi import YTMusic
+        client = YTMusic(requests_session=get_http_session(config))
+        yt_clients.yt = client
+    return client
+
+def parse_rate_limits(s):
+    limits = {}
+    for part in (s or "").split(","):
+        if "=" not in part: continue
+        host, rate = part.split("=", 1)
+        try: limits[host.strip().lower()] = float(rate)
+        except ValueError: pass
+    return limits
+
+class Scheduler():
+    # one concurrency budget for every job in the process. the limit grows by one while throughput keeps up
+    # and halves whenever a download looks throttled (AIMD); rate limited hosts also get a minimum spacing between requests.
+    # only ever used from the event loop, so waiters are plain futures woken in arrival order as slots free up
+    def __init__(self, max_limit, rate_limits = None, window = 10.0):
+        self.waiters = deque()
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self.active = 0
+        self.intervals = {host: 1.0 / rate for host, rate in (rate_limits or {}).items() if rate > 0}
+        self.host_next = {}
+        self.window = window
+        self.window_start = time.time()
+        self.window_done = 0
+        self.last_rate = 0.0
+        self.completed = 0
+        self.throttled = 0
+
+    def configure(self, max_limit, rate_limits = None):
+        self.max_limit = max_limit
+        self.limit = max(1, min(self.limit, max_limit))
+        if rate_limits is not None:
+            self.intervals = {host: 1.0 / rate for host, rate in rate_limits.items() if rate > 0}
+        self.wake()
+
+    async def throttle(self, host):
+        interval = self.intervals.get(host)
+        if not interval: return
+        now = time.time()
+        start = max(now, self.host_next.get(host, 0.0))
+        self.host_next[host] = start + interval
+        if start > now: await asyncio.sleep(start - now)
+
+    def wake(self):
+        free = self.limit - self.active
+        while free > 0 and self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    async def acquire(self, host = None):
+        while self.active >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # a wakeup meant for a cancelled task goes to the next one in line
+                if waiter.done() and not waiter.cancelled(): self.wake()
+                elif waiter in self.waiters: self.waiters.remove(waiter)
+                raise
+        self.active += 1
+        if host: await self.throttle(host)
+
+    def release(self, throttled = False):
+        saturated = self.active >= self.limit or bool(self.waiters)
+        self.active -= 1
+        if throttled:
+            self.throttled += 1
+            self.limit = max(1, self.limit // 2)
+            self.window_start, self.window_done = time.time(), 0
+        elif not saturated:
+            # below the limit throughput says nothing about the limit (a job winding down, or just not enough work),
+            # so those stretches are left out of the window instead of reading as a slowdown
+            self.completed += 1
+            self.window_start, self.window_done = time.time(), 0
+        else:
+            self.completed += 1
+            self.window_done += 1
+            elapsed = time.time() - self.window_start
+            if elapsed >= self.window:
+                rate = self.window_done / elapsed
+                if rate >= self.last_rate * 0.9: self.limit = min(self.max_limit, self.limit + 1)
+                else: self.limit = max(1, self.limit - 1)
+                self.last_rate = rate
+                self.window_start, self.window_done = time.time(), 0
+        # the next job's throughput isn't comparable with this one's
+        if not self.active and not self.waiters: self.last_rate = 0.0
+        self.wake()
+
+    @asynccontextmanager
+    async def slot(self, host = None):
+        await self.acquire(host)
+        throttled = False
+        try:
+            yield
+        except Exception as e:
+            throttled = bool(THROTTLE_ERRORS.search(str(e)))
+            raise
+        finally:
+            self.release(throttled)
+
+    def stats(self):
+        return {"limit": self.limit, "max_limit": self.max_limit, "active": self.active, "completed": self.completed, "throttled": self.throttled}
+
+def get_scheduler(config):
+    global scheduler
+    with scheduler_lock:
+        if scheduler is None:
+            scheduler = Scheduler(config["max_threads"], parse_rate_limits(config["host_rate_limits"]))
+        elif scheduler.max_limit != config["max_threads"]:
+            scheduler.configure(config["max_threads"])
+        return scheduler
+
+def log_scheduler_stats(config, logger : Logger = Logger()):
+    stats = get_scheduler(config).stats()
+    logger.out(f"Scheduler: concurrency {stats['limit']}/{stats['max_limit']}, {stats['completed']} downloads, {stats['throttled']} throttled")
+    rate = get_bandwidth(config).rate
+    if rate: logger.out(f"Bandwidth: {rate / (1024 * 1024):.2f} MB/s global budget")
+
+def parse_rate(s):
+    # bytes per second, with yt-dlp style K/M/G suffixes; 0 or empty means unlimited
+    m = re.fullmatch(r'\s*([\d.]+)\s*([kmg]?)i?b?\s*', str(s or "0"), re.IGNORECASE)
+    if not m: return 0
+    return int(float(m.group(1)) * 1024 ** " kmg".index(m.group(2).lower() or " "))
+
+def parse_rate_schedule(s):
+    # "01:00-07:00=0, 07:00-23:00=2M": windows may wrap past midnight, the first matching window wins
+    windows = []
+    for part in (s or "").split(","):
+        m = re.fullmatch(r'\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*=\s*(\S+)\s*', part)
+        if m: windows.append((int(m.group(1)) * 60 + int(m.group(2)), int(m.group(3)) * 60 + int(m.group(4)), parse_rate(m.group(5))))
+    return windows
+
+def scheduled_rate(windows, default, now = None):
+    now = time.localtime(now)
+    minute = now.tm_hour * 60 + now.tm_min
+    for start, end, rate in windows:
+        if (start <= minute < end) if start <= end else (minute >= start or minute < end): return rate
+    return default
+
+class TokenBucket():
+    # bytes per second with a second's worth of burst. reserve() goes into debt rather than refusing, and returns how long
+    # the caller has to sleep to pay it back; rate 0 never throttles. `active` counts the downloads drawing from it
+    def __init__(self, rate = 0):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.active = 0
+
+    def set_rate(self, rate):
+        with self.lock:
+            if rate != self.rate: self.rate, self.tokens = rate, min(self.tokens, float(rate))
+
+    def reserve(self, n):
+        with self.lock:
+            if not self.rate: return 0.0
+            now = time.monotonic()
+            self.tokens = min(float(self.rate), self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= n
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+class BandwidthShare():
+    # the buckets one download draws from: the global budget, its job's cap and its own. bytes are charged to all of them,
+    # so whatever a finished or idle download leaves unused is immediately there for the rest
+    def __init__(self, buckets):
+        self.buckets = [bucket for bucket in buckets if bucket]
+
+    def __enter__(self):
+        for bucket in self.buckets:
+            with bucket.lock: bucket.active += 1
+        return self
+
+    def __exit__(self, *args):
+        for bucket in self.buckets:
+            with bucket.lock: bucket.active -= 1
+
+    @property
+    def limited(self):
+        return any(bucket.rate for bucket in self.buckets)
+
+    def consume(self, n, cancelled : threading.Event = None):
+        if n <= 0: return
+        delay = max([bucket.reserve(n) for bucket in self.buckets], default=0.0)
+        if delay > 0:
+            if cancelled: cancelled.wait(delay)
+            else: time.sleep(delay)
+
+    def fair_rate(self):
+        # for engines that can only be given a fixed rate up front: an even split of every bucket among its current users
+        rates = [bucket.rate / max(1, bucket.active) for bucket in self.buckets if bucket.rate]
+        return int(min(rates)) if rates else None
+
+def get_bandwidth(config):
+    # the global bucket; its rate follows rate_schedule and is re-read whenever a download asks for it
+    global bandwidth
+    with scheduler_lock:
+        if bandwidth is None: bandwidth = TokenBucket()
+    bandwidth.set_rate(scheduled_rate(parse_rate_schedule(config["rate_schedule"]), parse_rate(config["rate_limit"])))
+    return bandwidth
+
+async def fetch_metadata(config, method, *args, **kwargs):
+    # ytmusicapi is blocking, so the call itself runs on a worker thread (with that thread's client)
+    await get_scheduler(config).throttle(METADATA_HOST)
+    return await asyncio.to_thread(lambda: getattr(get_yt(config), method)(*args, **kwargs))
+
+class MetadataCache():
+    # single-file store shared by every worker thread; entries carry their own ttl and are evicted least recently used first
+    def __init__(self, path : Path, max_entries = 5000, cache_only = False):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.cache_only = cache_only
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.evict_hooks = []
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT, fetched REAL, ttl REAL, accessed REAL)")
+        self.entries = self.db.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+
+    def lookup(self, key, ttl = None):
+        with self.lock:
+            row = self.db.execute("SELECT value, fetched, ttl FROM metadata WHERE key = ?", (key,)).fetchone()
+            if row is None: return None
+            value, fetched, row_ttl = row
+            if not self.cache_only and time.time() - fetched > (row_ttl if ttl is None else ttl): return None
+            self.db.execute("UPDATE metadata SET accessed = ? WHERE key = ?", (time.time(), key))
+        return json.loads(value)
+
+    def values(self, prefix):
+        with self.lock:
+            return [json.loads(row[0]) for row in self.db.execute("SELECT value FROM metadata WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))]
+
+    def store(self, key, value, ttl):
+        now = time.time()
+        evicted = False
+        with self.lock:
+            self.entries += self.db.execute("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?)", (key, json.dumps(value), now, ttl, now)).rowcount
+            # the count only ever overestimates (a replace counts as an insert), so it's resynced whenever it crosses the cap
+            if self.entries > self.max_entries:
+                self.entries = self.db.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+                if self.entries > self.max_entries:
+                    # evict a tenth extra so the next few stores don't have to evict again
+                    keep = self.max_entries - self.max_entries // 10
+                    self.db.execute("DELETE FROM metadata WHERE key NOT IN (SELECT key FROM metadata ORDER BY accessed DESC LIMIT ?)", (keep,))
+                    self.entries = keep
+                    evicted = True
+        # cleanup of whatever the evicted rows pointed at (cover files) runs off the caller's thread
+        if evicted:
+            for hook in self.evict_hooks: threading.Thread(target=hook, daemon=True).start()
+
+    async def get(self, key, fetch, ttl):
+        value = self.lookup(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        key_lock = self.key_locks.setdefault(key, asyncio.Lock())
+        try:
+            async with key_lock:
+                # another task may have fetched it while we waited
+                value = self.lookup(key)
+                if value is not None:
+                    self.hits += 1
+                    return value
+                if self.cache_only:
+                    raise LookupError(f"{key} is not cached (cache-only mode)")
+                self.misses += 1
+                value = await fetch()
+                if value is not None: self.store(key, value, ttl)
+            return value
+        finally:
+            # dropped even when fetch raised; a task still queued on it just re-checks the cache
+            if not key_lock.locked() and self.key_locks.get(key) is key_lock: self.key_locks.pop(key, None)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.db.execute("DELETE FROM metadata WHERE key = ?", (key,))
+
+def get_metadata_cache(config):
+    path = Path(config["cache_dir"]) / "metadata.db"
+    with cache_lock:
+        if path not in metadata_caches:
+            metadata_caches[path] = MetadataCache(path, config["cache_max_entries"], config["cache_only"])
+        cache = metadata_caches[path]
+        cache.cache_only = config["cache_only"]
+        return cache
+
+async def fetch_album(album_id, config):
+    return await get_metadata_cache(config).get(f"album:{album_id}", lambda: fetch_metadata(config, "get_album", album_id), config["cache_ttl"])
+
+async def fetch_album_browse_id(audio_playlist_id, config):
+    return await get_metadata_cache(config).get(f"browse:{audio_playlist_id}", lambda: fetch_metadata(config, "get_album_browse_id", audio_playlist_id), config["cache_ttl"])
+
+async def fetch_playlist(playlist_id, config):
+    # a sync always diffs against the live listing
+    if config["playlist_sync"] and not config["cache_only"]: get_metadata_cache(config).invalidate(f"playlist:{playlist_id}")
+    return await get_metadata_cache(config).get(f"playlist:{playlist_id}", lambda: fetch_metadata(config, "get_playlist", playlist_id, limit=None), config["playlist_cache_ttl"])
+
+class Track():
+    # one record per track; a big playlist keeps tens of thousands alive (every track of every album it touches), so no
+    # per instance dict. reads like the dict it replaced: track["title"], track.get("albumId")
+    __slots__ = ("videoId", "title", "artists", "trackNumber", "duration_seconds", "albumId", "albumName", "cover")
+
+    def __init__(self, videoId, title, artists = None, trackNumber = None, duration_seconds = None, albumId = None, albumName = None, cover = None):
+        self.videoId = videoId
+        self.title = title
+        self.artists = artists or []
+        self.trackNumber = trackNumber
+        self.duration_seconds = duration_seconds
+        self.albumId = albumId
+        self.albumName = albumName
+        self.cover = cover
+
+    def __getitem__(self, key):
+        try: return getattr(self, key)
+        except (AttributeError, TypeError): raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default = None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def keys(self):
+        return self.__slots__
+
+    def copy(self, **changes):
+        return Track(**{key: changes.get(key, getattr(self, key)) for key in self.__slots__})
+
+async def scrape_data(url : str = "", logger : Logger = Logger(), album_id = None, config = None):
+    if config is None: config = load_config()
+    is_playlist = False
     if not album_id:
         if not url: return
-        r_is_album_OLAK = re.search(r'list\=(OLAK5uy_.+)', url)
-        r_is_album_MPRE = re.search(r'list\=(MPREb_.+)', url)
-        r_is_playlist = re.search(r'list\=(PL.+)', url)
+        r_is_album_OLAK = re.search(r'list\=(OLAK5uy_[^&]+)', url)
+        r_is_album_MPRE = re.search(r'list\=(MPREb_[^&]+)', url)
+        r_is_playlist = re.search(r'list\=(PL[^&]+)', url)
 
-        is_playlist = False
         data = None
 
-        if r_is_album_MPRE or r_is_album_OLAK:
-            album_id = r_is_album_OLAK.group(1)
+        try:
             if r_is_album_OLAK:
-                album_id = yt.get_album_browse_id(album_id)
-            data = yt.get_album(album_id)
-        elif r_is_playlist:
-            is_playlist = True
-            playlist_id = r_is_playlist.group(1)
-            data = yt.get_playlist(playlist_id)
-        else:
-            logger.out("ERROR: CANT PARSE URL")
+                album_id = await fetch_album_browse_id(r_is_album_OLAK.group(1), config)
+                data = await fetch_album(album_id, config)
+            elif r_is_album_MPRE:
+                album_id = r_is_album_MPRE.group(1)
+                data = await fetch_album(album_id, config)
+            elif r_is_playlist:
+                is_playlist = True
+                playlist_id = r_is_playlist.group(1)
+                data = await fetch_playlist(playlist_id, config)
+            else:
+                logger.out("ERROR: CANT PARSE URL", LOG_ERROR)
+        except LookupError as e:
+            logger.out(f"ERROR: {e}", LOG_ERROR)
         if not data: return None
-    else: data = yt.get_album(album_id)
+    else: data = await fetch_album(album_id, config)
 
     if is_playlist:
         data_title = data.get("title")
@@ -103,20 +846,21 @@ def scrape_data(url : str = "", logger : Logger = Logger(), album_id = None):
         data_type = "playlist"
         data_cover_url = re.sub(r'=s\d+$', "=s1200", data.get("thumbnails")[0]["url"])
         data_track_count = data.get("trackCount")
-        data_albumId_cache = list(set(track["album"]["id"] for track in data["tracks"]))
+        data_albumId_cache = list(set(track["album"]["id"] for track in data["tracks"] if track.get("album")))
         data_videoIds = [track["videoId"] for track in data["tracks"]]
 
-        data["albumId_cache"] = data_albumId_cache
-        data["videoIds"] = data_videoIds
-
         data_tracks = []
         for track in data.get("tracks"):
             
-            data_tracks.append({
-                "videoId": track["videoId"],
-                "title": track["title"],
-                "artists": [a['name'] for a in track.get("artists", [])],
-            })
+            data_tracks.append(Track(
+                videoId=track["videoId"],
+                title=track["title"],
+                artists=[a['name'] for a in track.get("artists", [])],
+                albumId=(track.get("album") or {}).get("id"),
+                albumName=(track.get("album") or {}).get("name"),
+                duration_seconds=track.get("duration_seconds"),
+                cover=re.sub(r'w\d+-h\d+', "w1200-h1200", track["thumbnails"][-1]["url"]) if track.get("thumbnails") else None,
+            ))
 
     else:
         data_title = data.get('title')
@@ -125,10 +869,11 @@ def scrape_data(url : str = "", logger : Logger = Logger(), album_id = None):
         data_type = data.get('type').lower()
         data_cover_url = re.sub(r'w\d+-h\d+', "w1200-h1200", data.get('thumbnails')[0]['url'])
         data_track_count = data.get('trackCount')
-        data_tracks = [{key: ([a['name'] for a in track.get("artists", [])] if key == "artists" else track[key]) for key in ["videoId", "title", "artists", "trackNumber", "duration_seconds"]} for track in data.get('tracks', [])]
+        data_tracks = [Track(track["videoId"], track["title"], [a['name'] for a in track.get("artists", [])], track["trackNumber"], track["duration_seconds"]) for track in data.get('tracks', [])]
 
     data = {
         'url': url,
+        'id': playlist_id if is_playlist else album_id,
         'title': data_title,
         'artist': data_artist,
         'year': data_year,
@@ -137,116 +882,933 @@ def scrape_data(url : str = "", logger : Logger = Logger(), album_id = None):
         'trackcount': data_track_count,
         'tracks': data_tracks,
     }
+    if is_playlist:
+        data["albumId_cache"] = data_albumId_cache
+        data["videoIds"] = data_videoIds
 
     logger.out(f"Found: {data['title']} - {data['artist']}")
     logger.out(f"Type: {data['type']}")
-    logger.out(f"{data["trackcount"]} tracks found:")
-    if is_playlist:
-        logger.out(f"{"\n".join(f"   {track["title"]}" for track in data['tracks'])}")
-    else:
-        logger.out(f"{"\n".join(f"   {track["trackNumber"]}. {track["title"]}" for track in data['tracks'])}")
+    logger.out(f"{data['trackcount']} tracks found:")
+    if logger.enabled(LOG_DEBUG):
+        # a line per track rather than one string of the whole list
+        for track in data["tracks"]:
+            logger.out(f"   {track['title']}" if is_playlist else f"   {track['trackNumber']}. {track['title']}", LOG_DEBUG)
 
     return data
 
-def get_album_cover(cover_url, logger : Logger = Logger()):
-    logger.out("Getting Album Cover...")
+def normalise_cover_url(cover_url):
+    url = cover_url.split("?")[0].split("#")[0]
+    url = re.sub(r'^https?://', "https://", url, flags=re.IGNORECASE)
+    return re.sub(r'=(w\d+-h\d+|s\d+)[^/=]*$', "", url)
+
+def compress_cover(image_data):
+    max_size_bytes = 500 * 1024 #500kb
+    if len(image_data) <= max_size_bytes: return image_data
     try:
-        r = requests.get(cover_url)
+        from PIL import Image
+        img = Image.open(io.BytesIO(image_data))
+        if img.mode != "RGB": img = img.convert("RGB")
+        output = io.BytesIO()
+        img.save(output, format="JPEG", quality=85)
+        return output.getvalue()
+    except:
+        return image_data
+
+def make_cover_thumbnail(image_data, size = 300):
+    try:
+        from PIL import Image
+        img = Image.open(io.BytesIO(image_data))
+        if img.mode != "RGB": img = img.convert("RGB")
+        img.thumbnail((size, size), Image.LANCZOS)
+        output = io.BytesIO()
+        img.save(output, format="JPEG", quality=90)
+        return output.getvalue()
+    except:
+        return None
+
+class CoverCache():
+    # covers are stored once by content hash, already compressed, next to a pre-scaled thumbnail for the gui;
+    # the url -> hash mapping lives in the metadata cache so it shares its ttl and eviction
+    def __init__(self, path : Path, metadata : MetadataCache, ttl):
+        path.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.metadata = metadata
+        self.ttl = ttl
+        self.sweep_lock = threading.Lock()
+        metadata.evict_hooks.append(self.sweep)
+
+    def sweep(self):
+        # drops the files of covers no url maps to any more (evicted, or replaced by a newer cover). files younger
+        # than a minute are left alone, their mapping may not be stored yet
+        if not self.sweep_lock.acquire(blocking=False): return
+        try:
+            referenced = set(self.metadata.values("cover:"))
+            cutoff = time.time() - 60
+            for file in self.path.glob("*.jpg"):
+                if file.stem.split("_")[0] in referenced: continue
+                try:
+                    if file.stat().st_mtime < cutoff: file.unlink()
+                except OSError:
+                    pass
+        finally:
+            self.sweep_lock.release()
+
+    def file_for(self, digest, thumbnail = False):
+        return self.path / (f"{digest}_300.jpg" if thumbnail else f"{digest}.jpg")
+
+    def lookup(self, cover_url):
+        digest = self.metadata.lookup(f"cover:{normalise_cover_url(cover_url)}")
+        if digest and self.file_for(digest).exists(): return digest
+        return None
+
+    def store(self, cover_url, image_data):
+        cover = compress_cover(image_data)
+        digest = hashlib.sha256(cover).hexdigest()
+        cover_file = self.file_for(digest)
+        if not cover_file.exists():
+            temp_file = cover_file.with_suffix(f".{threading.get_ident()}.tmp")
+            temp_file.write_bytes(cover)
+            os.replace(temp_file, cover_file)
+            thumbnail = make_cover_thumbnail(cover)
+            if thumbnail: self.file_for(digest, thumbnail=True).write_bytes(thumbnail)
+        self.metadata.store(f"cover:{normalise_cover_url(cover_url)}", digest, self.ttl)
+        return digest
+
+    def read(self, digest, thumbnail = False):
+        try: return self.file_for(digest, thumbnail).read_bytes()
+        except OSError: return None
+
+def get_cover_cache(config):
+    metadata = get_metadata_cache(config)
+    path = Path(config["cache_dir"]) / "covers"
+    with cache_lock:
+        if path not in cover_caches:
+            cover_caches[path] = CoverCache(path, metadata, config["cache_ttl"])
+        return cover_caches[path]
+
+async def get_album_cover(cover_url, logger : Logger = Logger(), config = None):
+    if config is None: config = load_config()
+    cache = get_cover_cache(config)
+    digest = cache.lookup(cover_url)
+    if digest: return await asyncio.to_thread(cache.read, digest)
+    if config["cache_only"]: return None
+
+    logger.out("Getting Album Cover...", LOG_DEBUG)
+    try:
+        r = await asyncio.to_thread(get_http_session(config).get, cover_url)
         if r.status_code == 200:
-            image_data = r.content
-            max_size_bytes = 500 * 1024 #500kb
-            if len(image_data) <= max_size_bytes: return image_data
-            try:
-                img = Image.open(io.BytesIO(image_data))
-                if img.mode != "RGB": img = img.convert("RGB")
-                output = io.BytesIO()
-                img.save(output, format="JPEG", quality=85)
-                return output.getvalue()
-            except:
-                return image_data
+            return await asyncio.to_thread(lambda: cache.read(cache.store(cover_url, r.content)))
     except:
         pass
     return None
 
-def save_album_cover(cover, artist, album, dir, logger : Logger = Logger()):
+def get_album_cover_thumbnail(cover_url, config = None):
+    if config is None: config = load_config()
+    cache = get_cover_cache(config)
+    digest = cache.lookup(cover_url)
+    return cache.read(digest, thumbnail=True) if digest else None
+
+def save_album_cover(cover, artist, album, dir, logger : Logger = Logger(), config = None):
     if dir and cover:
         try:
             safe_art = sanitise(artist); safe_alb = sanitise(album)
             path = dir / f"{safe_art} - {safe_alb}.jpg"
             if not path.exists():
-                with open(path, "wb") as f: f.write(cover)
-            logger.out("Cover Saved...")
+                cached = get_cover_cache(config).file_for(hashlib.sha256(cover).hexdigest()) if config else None
+                try:
+                    if not cached or not cached.exists(): raise OSError
+                    os.link(cached, path)
+                except OSError:
+                    with open(path, "wb") as f: f.write(cover)
+            logger.out("Cover Saved...", LOG_DEBUG)
         except: pass
 
 def sanitise(s):
     if not s: return "Unknown"
     return re.sub(r'[<>:"/\\|?*]', '', s).strip()
 
-def download_track(track, data, config, cover_data, logger : Logger = Logger()):
-    local_yt_dlp = os.path.join(os.getcwd(), "yt-dlp.exe")
-    temp_path = Path(config["temp_dir"])
-    final_album_dir = Path(config["out_dir"]) / f"{sanitise(data['artist'])} - {sanitise(data['title'])}"
+async def run_hidden(cmd, stdout = subprocess.PIPE, stderr = subprocess.PIPE, on_line = None):
+    # the child is killed if the awaiting task is cancelled, so stopping a job really stops yt-dlp and ffmpeg.
+    # with on_line, stdout is handed over line by line while the process runs
+    startup_info = None
+    if os.name == "nt":
+        startup_info = subprocess.STARTUPINFO()
+        startup_info.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    process = await asyncio.create_subprocess_exec(*cmd, stdout=stdout, stderr=stderr, startupinfo=startup_info)
 
-    artist_string = ", ".join(track['artists'])
-    artist_tag_string = "; ".join(track['artists'])
-    
-    temp_filename = f"{track['videoId']}.mp3"
-    temp_file_path = temp_path / temp_filename
-    
-    final_filename = f"{sanitise(str(track['trackNumber']))}. {sanitise(artist_string)} - {sanitise(track['title'])}.mp3"
-    final_file_path = final_album_dir / final_filename
+    async def read_lines():
+        lines = []
+        async for raw in process.stdout:
+            line = raw.decode(errors="replace").rstrip("\r\n")
+            on_line(line)
+            lines.append(line)
+        return "\n".join(lines).encode()
 
-    if final_file_path.exists():
-        logger.out(f"Skipping (Exists): {track['title']}")
+    try:
+        if on_line and process.stdout:
+            out, err = await asyncio.gather(read_lines(), process.stderr.read() if process.stderr else asyncio.sleep(0, b""))
+            await process.wait()
+        else:
+            out, err = await process.communicate()
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            try: process.kill()
+            except ProcessLookupError: pass
+            await process.wait()
+        raise
+    return process.returncode, (out or b"").decode(errors="replace"), (err or b"").decode(errors="replace")
+
+class SubprocessEngine():
+    name = "subprocess"
+
+    def __init__(self, config):
+        self.command = [config["yt_dlp_path"]] if isinstance(config["yt_dlp_path"], str) else list(config["yt_dlp_path"])
+        self.ffmpeg_dir = config["ffmpeg_dir"]
+
+    async def download(self, url, temp_path : Path, name : str, logger : Logger = Logger(), format = AUDIO_FORMATS["mp3"][0], progress = None, share : BandwidthShare = None):
+        cmd = self.command + [
+            "--no-check-certificates",
+            "-f", format,
+            "--ffmpeg-location", self.ffmpeg_dir,
+            "--print", "after_move:filepath",
+            "-o", os.path.join(temp_path, f"{name}.%(ext)s"),
+        ]
+        rate = share.fair_rate() if share else None
+        if rate: cmd += ["--limit-rate", str(rate)]
+        if progress:
+            cmd += ["--progress", "--newline", "--progress-template", f"download:{PROGRESS_PREFIX}%(progress.downloaded_bytes)s %(progress.total_bytes,progress.total_bytes_estimate)s"]
+
+        def on_line(line):
+            if not line.startswith(PROGRESS_PREFIX): return
+            downloaded, _, total = line[len(PROGRESS_PREFIX):].partition(" ")
+            try: progress(int(downloaded), int(float(total)) if total not in ("", "NA") else None)
+            except ValueError: pass
+
+        returncode, stdout, stderr = await run_hidden(cmd + [url], on_line=on_line if progress else None)
+        lines = [line for line in stdout.strip().splitlines() if not line.startswith(PROGRESS_PREFIX)]
+        if returncode != 0 or not lines:
+            # the tail of stderr carries yt-dlp's own error ("HTTP Error 429: Too Many Requests"), which the scheduler
+            # needs to tell throttling apart from other failures
+            errors = [line for line in stderr.strip().splitlines() if line.strip()]
+            raise RuntimeError(f"yt-dlp exited with code {returncode}" + (f": {' | '.join(errors[-3:])}" if errors else ""))
+        return Path(lines[-1])
+
+class LibraryEngine():
+    # one YoutubeDL per worker thread, so extractors and the HTTP session are set up once and reused. downloads run on
+    # the engine's own pool; a cancelled task flags its download, which the progress hook turns into an abort
+    name = "library"
+
+    def __init__(self, config):
+        import yt_dlp
+        self.yt_dlp = yt_dlp
+        self.ffmpeg_dir = config["ffmpeg_dir"]
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=max(32, config["max_threads"]), thread_name_prefix="yt-dlp")
+
+    def get_ydl(self):
+        ydl = getattr(self.local, "ydl", None)
+        if ydl is None:
+            ydl = self.yt_dlp.YoutubeDL({
+                "format": AUDIO_FORMATS["mp3"][0],
+                "nocheckcertificate": True,
+                "ffmpeg_location": self.ffmpeg_dir,
+                "quiet": True,
+                "noprogress": True,
+                "no_warnings": True,
+                "progress_hooks": [self.progress],
+            })
+            self.local.ydl = ydl
+        return ydl
+
+    def progress(self, d):
+        if self.local.cancelled.is_set(): raise self.yt_dlp.utils.DownloadCancelled()
+        if self.local.share and d.get("status") == "downloading":
+            # the hook runs after every block, so sleeping here paces the download against the shared buckets. the first
+            # report only sets the baseline: on a resumed download it already counts the .part file from the last run
+            downloaded = d.get("downloaded_bytes") or 0
+            if self.local.downloaded is not None and downloaded > self.local.downloaded:
+                self.local.share.consume(downloaded - self.local.downloaded, self.local.cancelled)
+            self.local.downloaded = downloaded
+        if self.local.on_progress and d.get("status") in ("downloading", "finished"):
+            self.local.on_progress(d.get("downloaded_bytes"), d.get("total_bytes") or d.get("total_bytes_estimate"))
+
+    def run(self, url, temp_path : Path, name : str, format, cancelled : threading.Event, progress = None, share : BandwidthShare = None):
+        ydl = self.get_ydl()
+        self.local.cancelled = cancelled
+        self.local.on_progress = progress
+        self.local.share = share if share and share.limited else None
+        self.local.downloaded = None
+        # small fixed blocks keep a shaped download smooth instead of arriving in multi-megabyte bursts
+        ydl.params["buffersize"] = 64 * 1024 if self.local.share else 1024
+        ydl.params["noresizebuffer"] = bool(self.local.share)
+        ydl.params["format"] = format
+        ydl.params["outtmpl"]["default"] = os.path.join(temp_path, f"{name}.%(ext)s")
+        info = ydl.extract_info(url, download=True)
+        return Path(info["requested_downloads"][0]["filepath"])
+
+    async def download(self, url, temp_path : Path, name : str, logger : Logger = Logger(), format = AUDIO_FORMATS["mp3"][0], progress = None, share : BandwidthShare = None):
+        cancelled = threading.Event()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self.run, url, temp_path, name, format, cancelled, progress, share)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+DOWNLOAD_ENGINES = {
+    "library": LibraryEngine,
+    "subprocess": SubprocessEngine,
+}
+
+def get_download_engine(config, logger : Logger = Logger()):
+    name = config.get("engine", "library")
+    with engine_lock:
+        if name not in download_engines:
+            try:
+                download_engines[name] = DOWNLOAD_ENGINES[name](config)
+            except Exception as e:
+                if name == "subprocess": raise
+                logger.out(f"Engine '{name}' unavailable ({e}), falling back to subprocess", LOG_WARNING)
+                download_engines[name] = SubprocessEngine(config)
+        return download_engines[name]
+
+def get_ffmpeg(config):
+    return shutil.which("ffmpeg", path=config["ffmpeg_dir"]) or shutil.which("ffmpeg") or "ffmpeg"
+
+JOB_STATES = ["queued", "downloaded", "transcoded", "tagged", "finalised"]
+
+class JobJournal():
+    # append-only json lines, one entry per state change; replaying the file gives the latest state of every track.
+    # a finished track only needs its state, so they all share one entry and a long job doesn't hold every file path
+    FINALISED = {"state": "finalised"}
+
+    def __init__(self, path : Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.tracks = {}
+        torn = False
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    torn = not line.endswith("\n")
+                    try: entry = json.loads(line)
+                    except ValueError: continue
+                    self.update(entry)
+        self.file = open(path, "a", encoding="utf-8")
+        if torn: self.file.write("\n")
+
+    def record(self, video_id, state, **extra):
+        entry = {"videoId": video_id, "state": state, "time": time.time(), **extra}
+        with self.lock:
+            self.update(entry)
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+
+    def update(self, entry):
+        if entry["state"] == "finalised":
+            self.tracks[entry["videoId"]] = self.FINALISED
+            return
+        current = self.tracks.get(entry["videoId"])
+        if current is None or current is self.FINALISED: current = self.tracks[entry["videoId"]] = {}
+        current.update(entry)
+
+    def reached(self, video_id, state):
+        entry = self.tracks.get(video_id)
+        if not entry or entry["state"] not in JOB_STATES: return False
+        return JOB_STATES.index(entry["state"]) >= JOB_STATES.index(state)
+
+    def pending(self):
+        return [video_id for video_id in self.tracks if not self.reached(video_id, "finalised")]
+
+    def close(self):
+        with self.lock: self.file.close()
+
+def open_job(data, config):
+    # temp files live in a per-job folder so concurrent jobs never touch each other's partial downloads
+    job_dir = Path(config["temp_dir"]) / sanitise(str(data.get("id") or f"{data['artist']} - {data['title']}"))
+    job_dir.mkdir(parents=True, exist_ok=True)
+    return job_dir, JobJournal(job_dir / "journal.jsonl")
+
+def close_job(job_dir : Path, journal : JobJournal, logger : Logger = Logger()):
+    journal.close()
+    pending = journal.pending()
+    if pending:
+        logger.out(f"{len(pending)} tracks unfinished, keeping {job_dir} to resume later", LOG_WARNING)
         return
+    shutil.rmtree(job_dir, ignore_errors=True)
 
-    cmd = [
-        str(local_yt_dlp),
-        "-x", "--audio-quality", "0",
-        "--no-check-certificates",
-        "-f", 'ba[acodec^=mp3]/ba/b',
-        "--audio-format", "mp3",
-        "--ffmpeg-location", os.getcwd(),
-        "-o", os.path.join(temp_path, f"{track['videoId']}.%(ext)s"),
-        f"https://www.youtube.com/watch?v={track['videoId']}",
-    ]
+def resume_path(job, state):
+    journal = job["journal"]
+    if not journal or not journal.reached(job["track"]["videoId"], state): return None
+    path = journal.tracks[job["track"]["videoId"]].get("file")
+    return Path(path) if path and Path(path).exists() else None
 
-    startup_info = None
-    if os.name == "nt":
-        startup_info = subprocess.STARTUPINFO()
-        startup_info.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+def record_state(job, state, **extra):
+    if job["journal"]: job["journal"].record(job["track"]["videoId"], state, **extra)
 
+def partial_bytes(job):
+    # a prefix match rather than a glob, which would leave a compiled pattern per videoId in the regex cache
+    prefix = f"{job['track']['videoId']}."
+    try: return sum(entry.stat().st_size for entry in os.scandir(job["temp_path"]) if entry.name.startswith(prefix) and entry.name.endswith(".part"))
+    except FileNotFoundError: return 0
+
+def read_tags(path : Path):
+    # the videoId plus what a file without one (anything downloaded before the tag existed) can still be matched on
     try:
-        logger.out(f"Downloading: {track['title']}")
-        subprocess.run(cmd,  stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT, startupinfo=startup_info)
-        logger.out(f"Tagging: {track['title']}")
+        import mutagen
+        audio = mutagen.File(path)
+        if audio is None: return {}
+        tags = audio.tags or {}
+
+        def first(*keys):
+            for key in keys:
+                if key in tags:
+                    value = tags[key]
+                    value = value.text if hasattr(value, "text") else value
+                    value = value[0] if isinstance(value, list) and value else value
+                    value = value.decode(errors="replace") if isinstance(value, bytes) else str(value)
+                    if value: return value
+            return None
+
+        return {
+            "video_id": first(f"TXXX:{VIDEO_ID_TAG}", f"----:com.apple.iTunes:{VIDEO_ID_TAG}", VIDEO_ID_TAG.lower()),
+            "artist": first("TPE2", "aART", "album_artist", "albumartist", "TPE1", "\xa9ART", "artist"),
+            "album": first("TALB", "\xa9alb", "album"),
+            "title": first("TIT2", "\xa9nam", "title"),
+            "duration": getattr(audio.info, "length", None),
+        }
+    except Exception:
+        return {}
+
+def library_key(artist, album, title):
+    # album artist, album and title with case, spacing and punctuation dropped ("A; B" and "A, B" read the same)
+    if not title: return None
+    return "|".join(normalise_title(value) for value in (artist, album, title))
+
+def sample_digest(path : Path, size, sample = 256 * 1024):
+    # first and last 256kb plus the size; cheap enough to run over a whole library and still tells copies apart
+    h = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        h.update(f.read(sample))
+        if size > sample * 2:
+            f.seek(-sample, os.SEEK_END)
+            h.update(f.read(sample))
+    return h.hexdigest()
+
+class LibraryIndex():
+    # every audio file under out_dir by path, with its videoId tag, a content digest and an artist/album/title key for
+    # files that predate the videoId tag. rescans only read files whose size or mtime changed, and a root is walked at
+    # most once per rescan_interval; finalise_track adds every new file in between
+    rescan_interval = 3600
+
+    def __init__(self, path : Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.scan_lock = threading.Lock()
+        self.scanned = {}
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS library (path TEXT PRIMARY KEY, video_id TEXT, size INTEGER, mtime REAL, digest TEXT, match_key TEXT, duration REAL)")
+        if "match_key" not in [row[1] for row in self.db.execute("PRAGMA table_info(library)")]:
+            # older indexes have no match keys; a mtime nobody has makes the next scan read every file's tags once
+            self.db.execute("ALTER TABLE library ADD COLUMN match_key TEXT")
+            self.db.execute("ALTER TABLE library ADD COLUMN duration REAL")
+            self.db.execute("UPDATE library SET mtime = -1")
+        self.db.execute("CREATE INDEX IF NOT EXISTS library_video_id ON library (video_id)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS library_digest ON library (digest)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS library_match_key ON library (match_key)")
+
+    def refresh(self, root : Path, logger : Logger = Logger()):
+        # what every job calls: the first job of a run (or batch, or daemon hour) walks the library, the rest wait for
+        # that walk instead of repeating it
+        with self.scan_lock:
+            if time.time() - self.scanned.get(root, 0) < self.rescan_interval: return
+            self.scan(root, logger)
+            self.scanned[root] = time.time()
+
+    def scan(self, root : Path, logger : Logger = Logger()):
+        if not root.exists(): return
+        with self.lock:
+            # the trailing separator keeps a sibling like /Music2 out of a scan of /Music
+            prefix = os.path.join(str(root), "")
+            known = {row[0]: (row[1], row[2]) for row in self.db.execute("SELECT path, size, mtime FROM library WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))}
+        seen = set()
+        changed = 0
+        for dir_path, _, file_names in os.walk(root):
+            for file_name in file_names:
+                path = Path(dir_path) / file_name
+                if path.suffix.lower() not in AUDIO_EXTENSIONS or file_name.startswith("."): continue
+                key = str(path)
+                seen.add(key)
+                try: stat = path.stat()
+                except OSError: continue
+                if known.get(key) == (stat.st_size, stat.st_mtime): continue
+                self.add(path, None, stat)
+                changed += 1
+        removed = [key for key in known if key not in seen]
+        with self.lock:
+            self.db.executemany("DELETE FROM library WHERE path = ?", [(key,) for key in removed])
+        logger.out(f"Library: {len(seen)} files indexed, {changed} updated, {len(removed)} removed")
+
+    def add(self, path : Path, video_id = None, stat = None, match_key = None, duration = None):
+        try:
+            stat = stat or path.stat()
+            digest = sample_digest(path, stat.st_size)
+        except OSError:
+            return
+        if video_id is None or match_key is None:
+            with self.lock:
+                # a moved or renamed file keeps its digest, so what we knew about it carries over without reading the tags
+                row = self.db.execute("SELECT video_id, match_key, duration FROM library WHERE digest = ? AND match_key IS NOT NULL", (digest,)).fetchone()
+            if row: video_id, match_key, duration = video_id or row[0], row[1], row[2]
+        if match_key is None:
+            tags = read_tags(path)
+            video_id = video_id or tags.get("video_id")
+            match_key, duration = library_key(tags.get("artist"), tags.get("album"), tags.get("title")), tags.get("duration")
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO library VALUES (?, ?, ?, ?, ?, ?, ?)", (str(path), video_id, stat.st_size, stat.st_mtime, digest, match_key, duration))
+
+    def find(self, video_id, match_key = None, duration = None):
+        # by videoId, else by artist/album/title with a duration within a few seconds. a file matched that way gets the
+        # videoId recorded, so the next lookup is a direct hit
+        with self.lock:
+            rows = [(path, None, False) for (path,) in self.db.execute("SELECT path FROM library WHERE video_id = ?", (video_id,))]
+            if match_key:
+                rows += [(path, length, True) for path, length in self.db.execute("SELECT path, duration FROM library WHERE match_key = ? AND video_id IS NULL", (match_key,))]
+        for path, length, fallback in rows:
+            if fallback and length and duration and abs(length - duration) > 3: continue
+            if not Path(path).exists(): continue
+            if fallback:
+                with self.lock: self.db.execute("UPDATE library SET video_id = ? WHERE path = ?", (video_id, path))
+            return Path(path)
+        return None
+
+def get_library_index(config):
+    path = Path(config["cache_dir"]) / "library.db"
+    with cache_lock:
+        if path not in library_indexes:
+            library_indexes[path] = LibraryIndex(path)
+        return library_indexes[path]
+
+class PlaylistSnapshots():
+    # what each playlist looked like after its last run: per position the videoId, its album, the file it landed in and
+    # whether the playlist created that file. a sync diffs the live listing against this instead of resolving and
+    # checking every track again
+    def __init__(self, path : Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS snapshot (playlist_id TEXT, position INTEGER, video_id TEXT, album_id TEXT, path TEXT, duration INTEGER, created INTEGER, PRIMARY KEY (playlist_id, position))")
+        if "created" not in [row[1] for row in self.db.execute("PRAGMA table_info(snapshot)")]:
+            # nobody knows who made the files of older snapshots, so a prune leaves them alone
+            self.db.execute("ALTER TABLE snapshot ADD COLUMN created INTEGER DEFAULT 0")
+        self.db.execute("CREATE TABLE IF NOT EXISTS playlists (playlist_id TEXT PRIMARY KEY, title TEXT, synced REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS snapshot_path ON snapshot (path)")
+
+    def load(self, playlist_id):
+        with self.lock:
+            rows = self.db.execute("SELECT position, video_id, album_id, path, duration, created FROM snapshot WHERE playlist_id = ? ORDER BY position", (playlist_id,)).fetchall()
+        return [{"position": row[0], "video_id": row[1], "album_id": row[2], "path": Path(row[3]), "duration": row[4], "created": bool(row[5])} for row in rows]
+
+    def save(self, playlist_id, title, entries):
+        # entries: (position, video_id, album_id, path, duration, created)
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                self.db.execute("DELETE FROM snapshot WHERE playlist_id = ?", (playlist_id,))
+                self.db.executemany("INSERT INTO snapshot VALUES (?, ?, ?, ?, ?, ?, ?)", [(playlist_id, position, video_id, album_id, str(path), duration, int(created)) for position, video_id, album_id, path, duration, created in entries])
+                self.db.execute("INSERT OR REPLACE INTO playlists VALUES (?, ?, ?)", (playlist_id, title, time.time()))
+                self.db.execute("COMMIT")
+            except:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def referenced(self, path : Path, exclude = None):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM snapshot WHERE path = ? AND playlist_id != ? LIMIT 1", (str(path), exclude or "")).fetchone() is not None
+
+def get_playlist_snapshots(config):
+    path = Path(config["cache_dir"]) / "playlists.db"
+    with cache_lock:
+        if path not in playlist_snapshots:
+            playlist_snapshots[path] = PlaylistSnapshots(path)
+        return playlist_snapshots[path]
+
+def find_final_file(job):
+    # native mode only knows the container after the download, so any audio extension counts as already there
+    final_file_path = job["final_file_path"]
+    if final_file_path.exists(): return final_file_path
+    if job["config"]["audio_format"] != "mp3":
+        for ext in AUDIO_EXTENSIONS:
+            if final_file_path.with_suffix(ext).exists(): return final_file_path.with_suffix(ext)
+    return None
 
+def link_from_library(job, library : LibraryIndex):
+    # an already owned copy of this videoId anywhere in the library is linked (or just referenced) instead of downloaded
+    track, config = job["track"], job["config"]
+    existing_final = find_final_file(job)
+    if existing_final:
+        job["final_file_path"] = existing_final
+        return True
+    existing = library.find(track["videoId"], library_key(", ".join(track["artists"]), job["data"]["title"], track["title"]), track.get("duration_seconds"))
+    if not existing: return False
+    if config["audio_format"] == "mp3" and existing.suffix.lower() != ".mp3": return False
+    final_file_path = job["final_file_path"] = job["final_file_path"].with_suffix(existing.suffix)
+
+    if config["library_mode"] == "reference":
+        job["final_file_path"] = existing
+    else:
+        job["linked"] = True
+        final_file_path.parent.mkdir(parents=True, exist_ok=True)
         try:
-            audio = MP3(temp_file_path)
-            if audio.tags is None:
-                audio.add_tags()            
-            audio.tags.delall("APIC")
-            audio.tags.add(TIT2(encoding=3, text=track["title"]))
-            audio.tags.add(TPE1(encoding=3, text=artist_tag_string))
-            audio.tags.add(TPE2(encoding=3, text=artist_string))
-            audio.tags.add(TALB(encoding=3, text=data["title"]))
-            audio.tags.add(TDRC(encoding=3, text=str(data["year"])))
-            audio.tags.add(TYER(encoding=3, text=str(data["year"])))
-            audio.tags.add(TRCK(encoding=3, text=str(track["trackNumber"])))
-            if cover_data:
-                audio.tags.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='', data=cover_data))
-            audio.save(v2_version=3)
-        except Exception as e:
-            logger.out(f"Tagging Error on {track['title']}: {e}")
-        shutil.move(temp_file_path, final_file_path)
-        logger.out(f"Finished: {track['title']}")
+            if config["library_mode"] != "hardlink": raise OSError
+            os.link(existing, final_file_path)
+        except OSError:
+            shutil.copy2(existing, final_file_path)
+        library.add(final_file_path, track["videoId"])
+    job["logger"].out(f"Found in library: {track['title']} ({existing})", LOG_DEBUG)
+    return True
+
+def new_track_job(track, data, config, cover_data, logger : Logger = Logger(), journal : JobJournal = None, telemetry : Telemetry = None):
+    artist_string = ", ".join(track['artists'])
+    final_album_dir = Path(config["out_dir"]) / f"{sanitise(data['artist'])} - {sanitise(data['title'])}"
+    final_ext = AUDIO_FORMATS.get(config["audio_format"], AUDIO_FORMATS["mp3"])[1]
+    final_filename = f"{sanitise(str(track['trackNumber']))}. {sanitise(artist_string)} - {sanitise(track['title'])}{final_ext}"
+
+    return {
+        "track": track,
+        "data": data,
+        "config": config,
+        "cover_data": cover_data,
+        "logger": logger,
+        "journal": journal,
+        "telemetry": telemetry,
+        "temp_path": Path(config["temp_dir"]),
+        "final_file_path": final_album_dir / final_filename,
+    }
 
-        return track["videoId"], track["duration_seconds"], final_file_path
+async def fetch_track(job):
+    track, config, logger = job["track"], job["config"], job["logger"]
+    existing_final = find_final_file(job)
+    if existing_final:
+        job["final_file_path"] = existing_final
+        logger.out(f"Skipping (Exists): {track['title']}", LOG_DEBUG)
+        record_state(job, "finalised", file=str(job["final_file_path"]))
+        return None
+
+    raw_file_path = resume_path(job, "downloaded")
+    if raw_file_path:
+        logger.out(f"Resuming: {track['title']}", LOG_DEBUG)
+        job["raw_file_path"] = raw_file_path
+        return job
+
+    partial = partial_bytes(job)
+    if partial:
+        logger.out(f"Resuming download at {partial // 1024} KB: {track['title']}", LOG_DEBUG)
+        record_state(job, "partial", bytes=partial)
+
+    engine = get_download_engine(config, logger)
+    url = config["watch_url"].format(track['videoId'])
+    try:
+        async with get_scheduler(config).slot(urlparse(url).hostname):
+            logger.out(f"Downloading: {track['title']}", LOG_DEBUG)
+            control = job.get("control")
+            progress = (lambda downloaded, total: control.update(job, downloaded, total)) if control else None
+            with BandwidthShare([get_bandwidth(config), job.get("job_bucket"), TokenBucket(parse_rate(config["track_rate_limit"]))]) as share:
+                job["raw_file_path"] = await engine.download(url, job["temp_path"], track['videoId'], logger, AUDIO_FORMATS.get(config["audio_format"], AUDIO_FORMATS["mp3"])[0], progress, share)
+    except:
+        partial = partial_bytes(job)
+        if partial: record_state(job, "partial", bytes=partial)
+        raise
+    record_state(job, "downloaded", file=str(job["raw_file_path"]))
+    if job["telemetry"]:
+        try: job["telemetry"].count("bytes_downloaded", job["raw_file_path"].stat().st_size)
+        except OSError: pass
+    return job
+
+def tag_fields(job):
+    track, data = job["track"], job["data"]
+    return {
+        "title": track["title"],
+        "artists": track["artists"],
+        "album_artist": ", ".join(track["artists"]),
+        "album": data["title"],
+        "year": str(data["year"]),
+        "track_number": str(track["trackNumber"]),
+        "video_id": track["videoId"],
+    }
 
-    except Exception as e:
-        logger.out(f"Error processing {track['title']}: {e}")
+def ffmetadata_escape(value):
+    return re.sub(r"([=;#\\\n])", r"\\\1", str(value))
+
+def write_ffmetadata(path : Path, fields, cover_data = None):
+    lines = [
+        ";FFMETADATA1",
+        f"title={ffmetadata_escape(fields['title'])}",
+        f"artist={ffmetadata_escape('; '.join(fields['artists']))}",
+        f"album_artist={ffmetadata_escape(fields['album_artist'])}",
+        f"album={ffmetadata_escape(fields['album'])}",
+        f"date={ffmetadata_escape(fields['year'])}",
+        f"track={ffmetadata_escape(fields['track_number'])}",
+        f"{VIDEO_ID_TAG}={ffmetadata_escape(fields['video_id'])}",
+    ]
+    if cover_data:
+        # vorbis comments carry the cover as a base64 flac picture block, the same one mutagen would write
+        from mutagen.flac import Picture
+        picture = Picture()
+        picture.type = 3
+        picture.mime = "image/jpeg"
+        picture.data = cover_data
+        lines.append(f"METADATA_BLOCK_PICTURE={ffmetadata_escape(base64.b64encode(picture.write()).decode('ascii'))}")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+def cover_file(job):
+    # ffmpeg reads the cover from disk; the cover cache normally already has this exact file
+    cover_data = job["cover_data"]
+    if not cover_data: return None
+    digest = hashlib.sha256(cover_data).hexdigest()
+    path = get_cover_cache(job["config"]).file_for(digest)
+    if path.exists(): return path
+    path = job["temp_path"] / f"cover-{digest}.jpg"
+    if not path.exists():
+        temp_file = path.with_suffix(f".{threading.get_ident()}.tmp")
+        temp_file.write_bytes(cover_data)
+        os.replace(temp_file, path)
+    return path
+
+async def transcode_track(job):
+    # a single ffmpeg pass encodes (or remuxes) the audio and writes tags and cover straight into the album folder,
+    # so the finished file is written once and only renamed into place afterwards. a playlist track may have been
+    # downloaded while its album's cover was still loading, this is the first stage that needs it
+    if "cover_future" in job: job["cover_data"] = await asyncio.shield(job.pop("cover_future"))
+    temp_file_path = resume_path(job, "transcoded")
+    if temp_file_path:
+        job["temp_file_path"] = temp_file_path
+        job["final_file_path"] = job["final_file_path"].with_suffix(temp_file_path.suffix)
+        return job
+
+    track, config, logger = job["track"], job["config"], job["logger"]
+    raw_file_path = job["raw_file_path"]
+    native = config["audio_format"] != "mp3"
+    ext = REMUX_EXTENSIONS.get(raw_file_path.suffix.lower(), ".m4a") if native else ".mp3"
+    final_file_path = job["final_file_path"] = job["final_file_path"].with_suffix(ext)
+    final_file_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_file_path = final_file_path.with_name(f".{final_file_path.stem}.part{ext}")
+
+    if raw_file_path.suffix.lower() == ext or native:
+        logger.out(f"Remuxing: {track['title']}", LOG_DEBUG)
+        codec = ["-c:a", "copy"]
+    else:
+        logger.out(f"Converting: {track['title']}", LOG_DEBUG)
+        codec = ["-c:a", "libmp3lame", "-q:a", "0"]
+
+    inputs = ["-i", str(raw_file_path)]
+    maps = ["-map", "0:a:0"]
+    metadata_file = None
+    if ext in FFMPEG_TAGGED:
+        fields = tag_fields(job)
+        metadata_file = write_ffmetadata(job["temp_path"] / f"{track['videoId']}.ffmetadata", fields, job["cover_data"] if ext != ".mp3" else None)
+        inputs += ["-i", str(metadata_file)]
+        maps += ["-map_metadata", "1"]
+        cover = cover_file(job) if ext == ".mp3" else None
+        if cover:
+            inputs += ["-i", str(cover)]
+            maps += ["-map", "2:0", "-c:v", "copy", "-disposition:v", "attached_pic", "-metadata:s:v", "title=Album cover", "-metadata:s:v", "comment=Cover (front)"]
+        if ext == ".mp3": maps += ["-id3v2_version", "3"]
+
+    cmd = [get_ffmpeg(config), "-y", "-loglevel", "error", *inputs, *maps, *codec, str(temp_file_path)]
+    try:
+        returncode, _, stderr = await run_hidden(cmd, stdout=subprocess.DEVNULL)
+    finally:
+        if metadata_file: metadata_file.unlink(missing_ok=True)
+    if returncode != 0:
+        temp_file_path.unlink(missing_ok=True)
+        raise RuntimeError(f"ffmpeg failed: {stderr.strip()}")
+    try: raw_file_path.unlink()
+    except: pass
+    job["temp_file_path"] = temp_file_path
+    record_state(job, "transcoded", file=str(temp_file_path))
+    return job
+
+def tag_m4a(path : Path, fields, cover_data):
+    # the moov atom sits at the end of the remuxed file, so growing it only rewrites the tail
+    from mutagen.mp4 import MP4, MP4Cover, MP4FreeForm
+    audio = MP4(path)
+    audio["\xa9nam"] = fields["title"]
+    audio["\xa9ART"] = fields["artists"]
+    audio["aART"] = fields["album_artist"]
+    audio["\xa9alb"] = fields["album"]
+    audio["\xa9day"] = fields["year"]
+    try: audio["trkn"] = [(int(fields["track_number"]), 0)]
+    except ValueError: pass
+    audio[f"----:com.apple.iTunes:{VIDEO_ID_TAG}"] = MP4FreeForm(fields["video_id"].encode())
+    if cover_data:
+        audio["covr"] = [MP4Cover(cover_data, imageformat=MP4Cover.FORMAT_JPEG)]
+    audio.save()
+
+# containers whose tags ffmpeg writes during transcode_track; the rest are tagged in place afterwards
+FFMPEG_TAGGED = {".mp3", ".opus", ".ogg"}
+TAG_WRITERS = {
+    ".m4a": tag_m4a,
+}
+
+async def tag_track(job):
+    track, logger = job["track"], job["logger"]
+    if resume_path(job, "tagged"): return job
+
+    tag_writer = TAG_WRITERS.get(job["temp_file_path"].suffix.lower())
+    if tag_writer:
+        logger.out(f"Tagging: {track['title']}", LOG_DEBUG)
+        try:
+            await asyncio.to_thread(tag_writer, job["temp_file_path"], tag_fields(job), job["cover_data"])
+        except Exception as e:
+            logger.out(f"Tagging Error on {track['title']}: {e}", LOG_ERROR)
+    record_state(job, "tagged", file=str(job["temp_file_path"]))
+    return job
+
+async def finalise_track(job):
+    # the tagged file already sits next to its final name, so this is a rename rather than a copy
+    os.replace(job["temp_file_path"], job["final_file_path"])
+    fields = tag_fields(job)
+    await asyncio.to_thread(get_library_index(job["config"]).add, job["final_file_path"], job["track"]["videoId"],
+        match_key=library_key(fields["album_artist"], fields["album"], fields["title"]), duration=job["track"].get("duration_seconds"))
+    record_state(job, "finalised", file=str(job["final_file_path"]))
+    job["logger"].out(f"Finished: {job['track']['title']}", LOG_DEBUG)
+    return job
+
+class PipelineStage():
+    def __init__(self, name, func, workers):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.semaphore = asyncio.Semaphore(workers)
+        self.waiting = 0
+        self.processed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+
+    def stats(self, elapsed):
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "queued": self.waiting,
+            "processed": self.processed,
+            "failed": self.failed,
+            "per_second": self.processed / elapsed if elapsed > 0 else 0.0,
+            "busy_seconds": self.busy_time,
+        }
+
+class Pipeline():
+    # every track is one task walking through the stages, and each stage's semaphore bounds how many tracks it works on.
+    # a track keeps its slot until the next stage has room, so a slow stage still holds back the one before it;
+    # None from a stage drops the job. while the control is paused no track starts another stage. with a window, put()
+    # admits at most that many tracks at once so a long track list is consumed as a stream; on_close sees every job leave
+    def __init__(self, stages, logger : Logger = Logger(), on_done = None, control : JobControl = None, window = None, on_close = None):
+        self.stages = [PipelineStage(name, func, workers) for name, func, workers in stages]
+        self.logger = logger
+        self.on_done = on_done
+        self.on_close = on_close
+        self.control = control
+        self.window = asyncio.Semaphore(window) if window else None
+        self.tasks = []
+        self.start_time = time.time()
+        self.submitted = 0
+        self.completed = 0
+
+    def expect(self, track, data):
+        # counts a track towards the progress totals before its job is admitted
+        if self.control: self.control.add({"track": track, "data": data})
+
+    async def put(self, job):
+        self.submitted += 1
+        if self.control:
+            job["control"] = self.control
+            self.control.add(job)
+        if self.window: await self.window.acquire()
+        self.tasks = [task for task in self.tasks if not task.done()]
+        self.tasks.append(asyncio.create_task(self.run(job)))
+
+    async def run(self, job):
+        telemetry = job.get("telemetry")
+        held = None
+        try:
+            for stage in self.stages:
+                queued = time.perf_counter()
+                stage.waiting += 1
+                try:
+                    if self.control: await self.control.wait()
+                    await stage.semaphore.acquire()
+                finally: stage.waiting -= 1
+                if held: held.semaphore.release()
+                held = stage
+
+                start = time.perf_counter()
+                if telemetry: telemetry.record(f"{stage.name}_wait", start - queued, job["track"]["videoId"])
+                try:
+                    result = await stage.func(job)
+                    failed = False
+                except Exception as e:
+                    self.logger.out(f"Error processing {job['track']['title']}: {e}", LOG_ERROR)
+                    result = None
+                    failed = True
+                busy = time.perf_counter() - start
+                if telemetry:
+                    telemetry.record(stage.name, busy, job["track"]["videoId"], failed=failed)
+                    if failed: telemetry.count("tracks_failed")
+                stage.busy_time += busy
+                stage.processed += 1
+                if failed: stage.failed += 1
+
+                if result is None: break
+                job = result
+            else:
+                if telemetry: telemetry.count("tracks_done")
+                self.completed += 1
+                if self.on_done: self.on_done(job)
+            if self.control: self.control.finish(job)
+        finally:
+            if held: held.semaphore.release()
+            if self.window: self.window.release()
+            if self.on_close: self.on_close(job)
+
+    async def close(self):
+        try:
+            await asyncio.gather(*self.tasks)
+        except asyncio.CancelledError:
+            await self.cancel()
+            raise
+
+    async def cancel(self):
+        # stops every admitted track and waits for them, so their child processes are killed and nothing keeps running
+        # after the job is closed. a no-op once close() has returned
+        for task in self.tasks: task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def stats(self):
+        elapsed = time.time() - self.start_time
+        return [stage.stats(elapsed) for stage in self.stages]
+
+    def summary(self):
+        failed = sum(stage.failed for stage in self.stages)
+        return {"tracks": self.submitted, "done": self.completed, "failed": failed, "skipped": self.submitted - self.completed - failed}
+
+    def log_stats(self):
+        for s in self.stats():
+            self.logger.out(f"   {s['stage']:<10} {s['processed']} done, {s['failed']} failed, {s['per_second']:.2f}/s, {s['workers']} workers")
+
+def new_track_pipeline(config, logger : Logger = Logger(), on_done = None, control : JobControl = None, on_close = None):
+    stages = [
+        ("download", fetch_track, config["max_threads"]),
+        ("transcode", transcode_track, os.cpu_count() or 4),
+        ("tag", tag_track, 2),
+        ("move", finalise_track, 1),
+    ]
+    # twice what the stages can hold keeps every stage fed while the rest of the list waits as plain track records
+    window = 2 * sum(workers for _, _, workers in stages)
+    return Pipeline(stages, logger=logger, on_done=on_done, control=control, window=window, on_close=on_close)
 
-def download_album(data, config, logger : Logger = Logger(), cover_data=None):
+async def download_album(data, config, logger : Logger = Logger(), cover_data=None, telemetry : Telemetry = None, control : JobControl = None):
     out_path = Path(config["out_dir"])
     cover_path = Path(config["cover_dir"])
     temp_path = Path(config["temp_dir"])
@@ -258,27 +1820,201 @@ def download_album(data, config, logger : Logger = Logger(), cover_data=None):
     cover_path.mkdir(parents=True, exist_ok=True)
     temp_path.mkdir(parents=True, exist_ok=True)
 
-    for f in temp_path.glob("*"):
-        try: f.unlink()
-        except: pass
+    job_dir, journal = open_job(data, config)
+    job_config = dict(config, temp_dir=str(job_dir))
+    if telemetry is None: telemetry = new_telemetry(data, config)
+    telemetry_token = http_telemetry.set(telemetry)
 
     logger.out(f"Starting Download: {data['artist']} - {data['title']}")
-    if cover_data is None: cover_data = get_album_cover(data["cover"])
-    save_album_cover(cover_data, data["artist"], data["title"], cover_path, logger)
-
-    start_timer()
-
-    with ThreadPoolExecutor(max_workers=config["max_threads"]) as executor:
-        executor.map(lambda track: download_track(track, data, config, cover_data, logger), data["tracks"])
-
-    stop_timer(logger=logger)
+    pipeline = new_track_pipeline(config, logger, control=control)
+    try:
+        with telemetry.span("cover"):
+            if cover_data is None: cover_data = await get_album_cover(data["cover"], logger=logger, config=config)
+            save_album_cover(cover_data, data["artist"], data["title"], cover_path, logger, config)
+
+        library = get_library_index(config)
+        with telemetry.span("library_scan"): await asyncio.to_thread(library.refresh, out_path, logger)
+
+        job_bucket = TokenBucket(parse_rate(config["job_rate_limit"]))
+        for track in data["tracks"]: pipeline.expect(track, data)
+        for track in data["tracks"]:
+            if track["videoId"] not in journal.tracks: journal.record(track["videoId"], "queued")
+            job = new_track_job(track, data, job_config, cover_data, logger, journal, telemetry)
+            job["job_bucket"] = job_bucket
+            await asyncio.to_thread(link_from_library, job, library)
+            await pipeline.put(job)
+        await pipeline.close()
+    finally:
+        # the feeder may have been stopped in put(), a library link or a cover lookup, before close() was reached
+        await pipeline.cancel()
+        close_job(job_dir, journal, logger)
+        http_telemetry.reset(telemetry_token)
+        telemetry.close(logger)
+
+    log_http_stats(logger)
+    log_scheduler_stats(config, logger)
+    pipeline.log_stats()
 
     logger.out(f"{'=' * 10}\nFINISHED DOWNLOADING ALBUM")
+    return pipeline.summary()
+
+class PlaylistWriter():
+    # one slot per playlist position, so entries stream in as tracks finish but always land in playlist order.
+    # each entry's file line is rendered once, and the file is replaced (atomically) at most every few seconds or
+    # entries while the prefix grows, plus once at close
+    flush_interval = 2.0
+    flush_entries = 100
+
+    def __init__(self, path : Path, title, tracks):
+        self.path = path
+        self.title = title
+        self.lock = threading.Lock()
+        self.titles = [f"{', '.join(track['artists'])} - {track['title']}" if track["artists"] else track["title"] for track in tracks]
+        self.slots = [None] * len(tracks)
+        self.lines = [None] * len(tracks)
+        self.ready = 0
+        self.pending = 0
+        self.flushed = time.time()
+        self.dirty = False
+
+    def render(self):
+        entries = [line for line in self.lines if line]
+        if self.path.suffix.lower() == ".pls":
+            lines = ["[playlist]"]
+            for n, (relative, length, title) in enumerate(entries, 1):
+                lines += [f"File{n}={relative}", f"Title{n}={title}", f"Length{n}={length}"]
+            lines += [f"NumberOfEntries={len(entries)}", "Version=2"]
+        else:
+            lines = ["#EXTM3U", f"#PLAYLIST:{self.title}"]
+            for relative, length, title in entries:
+                lines += [f"#EXTINF:{length},{title}", relative]
+        return "\n".join(lines) + "\n"
+
+    def relative(self, path : Path):
+        try: return os.path.relpath(path, self.path.parent)
+        except ValueError: return str(path)
+
+    def advance(self):
+        start = self.ready
+        while self.ready < len(self.slots) and self.slots[self.ready]: self.ready += 1
+        return self.ready - start
+
+    def set(self, position, path : Path, duration):
+        self.slots[position] = (Path(path), int(duration) if duration else -1, self.titles[position])
+        self.lines[position] = (self.relative(path), self.slots[position][1], self.titles[position])
+        self.dirty = True
+
+    def fill(self, entries):
+        # (position, path, duration) for tracks already on disk, written out with the next flush
+        with self.lock:
+            for position, path, duration in entries: self.set(position, path, duration)
+            self.pending += self.advance()
+
+    def add(self, position, path : Path, duration):
+        with self.lock:
+            self.set(position, path, duration)
+            self.pending += self.advance()
+            if self.pending >= self.flush_entries or (self.pending and time.time() - self.flushed >= self.flush_interval): self.flush()
+
+    def flush(self):
+        temp_file = self.path.with_suffix(self.path.suffix + ".tmp")
+        temp_file.write_text(self.render(), encoding="utf-8")
+        os.replace(temp_file, self.path)
+        self.pending = 0
+        self.flushed = time.time()
+        self.dirty = False
+
+    def close(self):
+        # a run that never got a single entry leaves the existing file alone
+        with self.lock:
+            if self.dirty: self.flush()
+
+def normalise_title(s):
+    return re.sub(r'\W+', '', (s or "").lower())
+
+def single_track_album(p_track, p_data):
+    # playlist entries without an album (uploads, plain videos) become a one track album of their own
+    artist = ", ".join(p_track["artists"]) or p_data["artist"]
+    track = p_track.copy(trackNumber=1)
+    return {
+        "url": "",
+        "id": None,
+        "title": p_track.get("albumName") or p_track["title"],
+        "artist": artist,
+        "year": p_data["year"],
+        "type": "single",
+        "cover": p_track.get("cover") or p_data["cover"],
+        "trackcount": 1,
+        "tracks": [track],
+    }, track
+
+async def resolve_playlist(p_data, config, logger = Logger(), telemetry : Telemetry = None, entries = None, ahead = 8):
+    # maps every playlist entry (or just the given (position, track) entries) to its album track so only the referenced
+    # tracks get downloaded, with album tags. yields (position, album_data, track) album by album as lookups finish, so
+    # the first downloads start with the first album rather than after the last; entries without a usable album come
+    # last, as one track albums. only `ahead` lookups run past what the caller has taken
+    cache = get_metadata_cache(config)
+    misses_before = cache.misses
+    if entries is None: entries = list(enumerate(p_data["tracks"]))
+    by_album = {}
+    for position, p_track in entries:
+        by_album.setdefault(p_track.get("albumId"), []).append((position, p_track))
+    unmatched = by_album.pop(None, [])
+
+    async def fetch(album_id):
+        try:
+            start = time.perf_counter()
+            album_data = await scrape_data("", logger=Logger(None), album_id=album_id, config=config)
+            if telemetry: telemetry.record("scrape", time.perf_counter() - start, album=album_id)
+            return album_id, album_data
+        except Exception as e:
+            logger.out(f"Error fetching album {album_id}: {e}", LOG_ERROR)
+            return album_id, None
 
-def download_playlist_album(album_id, p_data, config, playlist_file, logger = Logger()):
-    global playlist_write_index
-    album_data = scrape_data("", logger=logger, album_id=album_id)
-
+    album_ids = iter(list(by_album))
+    pending = set()
+    resolved = albums = skipped = skipped_seconds = 0
+    try:
+        while True:
+            while len(pending) < ahead:
+                album_id = next(album_ids, None)
+                if album_id is None: break
+                pending.add(asyncio.ensure_future(fetch(album_id)))
+            if not pending: break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                album_id, album_data = task.result()
+                if not album_data:
+                    unmatched += by_album.pop(album_id)
+                    continue
+                by_video_id = {track["videoId"]: track for track in album_data["tracks"]}
+                by_title = {normalise_title(track["title"]): track for track in album_data["tracks"]}
+                matched = []
+                for position, p_track in by_album.pop(album_id):
+                    track = by_video_id.get(p_track["videoId"]) or by_title.get(normalise_title(p_track["title"]))
+                    if track is None: unmatched.append((position, p_track))
+                    else: matched.append((position, track))
+                if not matched: continue
+                # nothing downstream needs the album tracks the playlist doesn't use
+                wanted = {id(track) for _, track in matched}
+                skipped += len(album_data["tracks"]) - len(wanted)
+                skipped_seconds += sum(track.get("duration_seconds") or 0 for track in album_data["tracks"] if id(track) not in wanted)
+                album_data["tracks"] = [track for track in album_data["tracks"] if id(track) in wanted]
+                albums += 1
+                for position, track in matched:
+                    resolved += 1
+                    yield position, album_data, track
+        for position, p_track in sorted(unmatched, key=lambda entry: entry[0]):
+            resolved += 1
+            yield (position, *single_track_album(p_track, p_data))
+    finally:
+        for task in pending: task.cancel()
+
+    lookups = cache.misses - misses_before
+    logger.out(f"Resolved {resolved} playlist tracks across {albums} albums ({lookups} album lookups, {max(0, albums - lookups)} cached)")
+    logger.out(f"Skipping {skipped} unreferenced album tracks: ~{skipped_seconds * SOURCE_BYTES_PER_SECOND / (1024 * 1024):.0f} MB and ~{skipped * REQUESTS_PER_DOWNLOAD} requests saved")
+
+async def prepare_album(album_data, config, logger = Logger(), telemetry : Telemetry = None):
     out_path = Path(config["out_dir"])
     cover_path = Path(config["cover_dir"])
 
@@ -286,31 +2022,60 @@ def download_playlist_album(album_id, p_data, config, playlist_file, logger = Lo
     final_album_dir.mkdir(parents=True, exist_ok=True)
 
     logger.out(f"Starting Download: {album_data['artist']} - {album_data['title']}")
-    if cover_data is None: cover_data = get_album_cover(album_data["cover"])
-    save_album_cover(cover_data, album_data["artist"], album_data["title"], cover_path, logger)
-
-    with ThreadPoolExecutor(max_workers=12) as executor:
-        futures = {executor.submit(download_track, track, album_data, config, cover_data, logger): track for track in album_data["tracks"]}
-        for future in as_completed(futures):
-            video_id, final_file_path = futures[future]
-
-            if video_id in p_data["videoIds"]:
-                # add to playlsit file
-                with file_lock:
-                    playlsit_string = f"File{playlist_write_index}={final_file_path}"
-                    try:
-                        playlist_file.write(playlsit_string)
-                        playlist_file.flush()
-                        playlist_write_index += 1
-                    except:
-                        pass
-
-
-
-def download_playlist(p_data, config, logger = Logger()):
-    global playlist_write_index
-    playlist_write_index = 0
-
+    start = time.perf_counter()
+    cover_data = await get_album_cover(album_data["cover"], logger=logger, config=config)
+    save_album_cover(cover_data, album_data["artist"], album_data["title"], cover_path, logger, config)
+    if telemetry: telemetry.record("cover", time.perf_counter() - start, album=album_data["id"])
+    return cover_data
+
+class CoverLeases():
+    # cover bytes held only while a track of their album is in the pipeline: the first lease starts loading the cover as
+    # its own task, the last release drops it, and an album that comes round again reloads it from the disk cache. loop only
+    def __init__(self, load):
+        self.load = load
+        self.entries = {}
+
+    def lease(self, key, *args):
+        # the cover's future, not awaited here; whoever needs the bytes awaits it shielded
+        entry = self.entries.get(key)
+        if entry is None: entry = self.entries[key] = [asyncio.ensure_future(self.load(*args)), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def release(self, key):
+        entry = self.entries.get(key)
+        if entry is None: return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            entry[0].cancel()
+            del self.entries[key]
+
+    def close(self):
+        for task, _ in self.entries.values(): task.cancel()
+        self.entries.clear()
+
+def prune_tracks(removed, out_path : Path, mode, keep_paths, snapshots : PlaylistSnapshots, playlist_id, logger : Logger = Logger()):
+    # files of tracks that left the playlist: "keep" leaves them, "delete" removes them and "archive" moves them under
+    # out_dir/_archive. only files the playlist created itself are touched, never one it found already there (an
+    # album download, a library file it references), and a file still used by this or another synced playlist is kept
+    pruned = 0
+    for entry in removed:
+        path = entry["path"]
+        if mode not in ("delete", "archive") or not entry["created"] or path in keep_paths or not path.exists() or snapshots.referenced(path, playlist_id): continue
+        try:
+            if mode == "delete":
+                path.unlink()
+            else:
+                try: archived = out_path / "_archive" / path.relative_to(out_path)
+                except ValueError: archived = out_path / "_archive" / path.name
+                archived.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(path, archived)
+            pruned += 1
+        except OSError as e:
+            logger.out(f"Could not {mode} {path}: {e}", LOG_WARNING)
+    if removed: logger.out(f"Sync: {len(removed)} tracks removed from the playlist, {pruned} files {'deleted' if mode == 'delete' else 'archived' if mode == 'archive' else 'pruned'}")
+
+async def download_playlist(p_data, config, logger = Logger(), telemetry : Telemetry = None, control : JobControl = None):
     out_path = Path(config["out_dir"])
     cover_path = Path(config["cover_dir"])
     temp_path = Path(config["temp_dir"])
@@ -318,277 +2083,570 @@ def download_playlist(p_data, config, logger = Logger()):
     cover_path.mkdir(parents=True, exist_ok=True)
     temp_path.mkdir(parents=True, exist_ok=True)
 
-    playlsit_file_path = Path(out_path / f"{p_data["artist"]} - {p_data["title"]}.pls")
+    playlist_ext = "m3u8" if config["playlist_format"].lower() == "m3u8" else "pls"
+    playlist_file_path = out_path / f"{sanitise(p_data['artist'])} - {sanitise(p_data['title'])}.{playlist_ext}"
+    playlist = PlaylistWriter(playlist_file_path, p_data["title"], p_data["tracks"])
+
+    job_dir, journal = open_job(p_data, config)
+    job_config = dict(config, temp_dir=str(job_dir))
+
+    if telemetry is None: telemetry = new_telemetry(p_data, config)
+    telemetry_token = http_telemetry.set(telemetry)
+    def add_to_playlist(job, created = False):
+        # once placed, only the first position is kept; a later duplicate takes its file from that slot
+        if created: created_paths.add(job["final_file_path"])
+        positions = queued[job["track"]["videoId"]]
+        for position in positions: playlist.add(position, job["final_file_path"], job["track"].get("duration_seconds"))
+        queued[job["track"]["videoId"]] = positions[0]
+
+    # every track goes through the one windowed pipeline, so the global scheduler is the only download limit and only
+    # the covers of albums with a track in flight are in memory. covers load alongside the downloads, a few at a time
+    prepared = set()
+
+    async def load_cover(album_data):
+        async with cover_slots:
+            if id(album_data) in prepared: return await get_album_cover(album_data["cover"], logger=logger, config=config)
+            prepared.add(id(album_data))
+            return await prepare_album(album_data, config, logger, telemetry)
+
+    covers = CoverLeases(load_cover)
+    cover_slots = asyncio.Semaphore(5)
+    pipeline = new_track_pipeline(config, logger, on_done=lambda job: add_to_playlist(job, created=True), control=control, on_close=lambda job: covers.release(id(job["data"])))
+
+    # every run leaves a snapshot. its files (matched by videoId) start out in the playlist, and a sync only resolves and
+    # downloads the tracks that aren't in it (or lost their file)
+    snapshots = get_playlist_snapshots(config)
+    previous = snapshots.load(p_data["id"])
+    album_ids = {entry["video_id"]: entry["album_id"] for entry in previous}
+    known = {entry["video_id"]: entry for entry in previous if entry["path"].exists()}
+    # files this playlist downloaded or linked in, the only ones a prune may remove later
+    created_paths = {entry["path"] for entry in previous if entry["created"]}
+    entries = list(enumerate(p_data["tracks"]))
+    playlist.fill([(position, known[track["videoId"]]["path"], known[track["videoId"]]["duration"]) for position, track in entries if track["videoId"] in known])
+    removed = []
+    if config["playlist_sync"]:
+        current = {track["videoId"] for track in p_data["tracks"]}
+        removed = [entry for entry in previous if entry["video_id"] not in current]
+        entries = [(position, track) for position, track in entries if track["videoId"] not in known]
+        logger.out(f"Sync: {len(p_data['tracks']) - len(entries)} tracks unchanged, {len(entries)} to download, {len(removed)} removed")
 
-    for f in temp_path.glob("*"):
-        try: f.unlink()
-        except: pass
-
-    start_timer()
-    with open(playlsit_file_path, "w") as playlist_file:
-        playlist_file.write("[playlist]")
-        playlist_file.flush()
-
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            executor.map(lambda album_id: download_playlist_album(album_id, p_data, config, playlist_file, logger), p_data["albumId_cache"])
-
-        playlist_file.write("Version=2")
-        playlist_file.flush()
-    stop_timer(logger=logger)
+    try:
+        library = get_library_index(config)
+        if entries:
+            with telemetry.span("library_scan"): await asyncio.to_thread(library.refresh, out_path, logger)
+        # a videoId listed more than once is downloaded once and fills every one of its positions
+        positions = {}
+        for position, track in entries: positions.setdefault(track["videoId"], []).append(position)
+        unique = [(position, track) for position, track in entries if positions[track["videoId"]][0] == position]
+
+        job_bucket = TokenBucket(parse_rate(config["job_rate_limit"]))
+        queued = {}
+        async with aclosing(resolve_playlist(p_data, config, logger, telemetry, unique)) as resolved:
+            async for position, album_data, track in resolved:
+                video_id = p_data["tracks"][position]["videoId"]
+                album_ids[video_id] = album_data["id"]
+                placed = queued.get(track["videoId"])
+                if placed is not None:
+                    # two playlist entries (a video and its album version) resolved to the same album track
+                    if isinstance(placed, int):
+                        for p in positions[video_id]: playlist.add(p, playlist.slots[placed][0], track.get("duration_seconds"))
+                    else: placed += positions[video_id]
+                    continue
+                if track["videoId"] not in journal.tracks: journal.record(track["videoId"], "queued")
+                job = new_track_job(track, album_data, job_config, None, logger, journal, telemetry)
+                job["cover_future"] = covers.lease(id(album_data), album_data)
+                queued[track["videoId"]] = list(positions[video_id])
+                job["job_bucket"] = job_bucket
+                if await asyncio.to_thread(link_from_library, job, library): add_to_playlist(job, created=job.get("linked", False))
+                await pipeline.put(job)
+        await pipeline.close()
+        prune_tracks(removed, out_path, config["sync_prune"], {slot[0] for slot in playlist.slots if slot}, snapshots, p_data["id"], logger)
+    finally:
+        await pipeline.cancel()
+        covers.close()
+        playlist.close()
+        # only positions whose file is on disk go in, so a track that failed is retried by the next sync
+        snapshots.save(p_data["id"], p_data["title"], [(position, track["videoId"], album_ids.get(track["videoId"]), slot[0], slot[1], slot[0] in created_paths)
+            for position, (track, slot) in enumerate(zip(p_data["tracks"], playlist.slots)) if slot])
+        close_job(job_dir, journal, logger)
+        http_telemetry.reset(telemetry_token)
+        telemetry.close(logger)
+    log_http_stats(logger)
+    log_scheduler_stats(config, logger)
+    pipeline.log_stats()
     logger.out(f"{'=' * 10}\nFINISHED DOWNLOADING PLAYLIST")
-
-    
-
-
-class Worker(QThread):
-    log_signal = Signal(str)
-    finished_signal = Signal()
-    data_signal = Signal(dict, bytes)
-
-    def __init__(self, url, config, data_only = False):
-        super().__init__()
-        self.url = url
-        self.config = config
-        self.data_only = data_only
-
-    def run(self):
-        logger = Logger(logger=self.log_signal.emit)
-        data = scrape_data(self.url, logger=logger)
-        if data:
-            cover_data = get_album_cover(data["cover"], logger=logger)
-            self.data_signal.emit(data, cover_data if cover_data else b'')
-
-            if not self.data_only:
-                if data["type"] == "playlist":
-                    download_playlist(data, self.config, logger=logger)
-                else:
-                    download_album(data, self.config, logger=logger, cover_data=cover_data)
-
-        self.finished_signal.emit()
-
-class MusicDownloaderGUI(QWidget):
-    def __init__(self, config):
-        super().__init__()
-        self.setWindowTitle("Music Downloader")
-        self.resize(900,600)
-
+    return pipeline.summary()
+
+
+async def download_data(data, config, logger : Logger = Logger(), cover_data = None, telemetry : Telemetry = None, control : JobControl = None):
+    if data["type"] == "playlist":
+        return await download_playlist(data, config, logger=logger, telemetry=telemetry, control=control)
+    return await download_album(data, config, logger=logger, cover_data=cover_data, telemetry=telemetry, control=control)
+
+async def scrape_job(url, config, logger : Logger = Logger()):
+    start = time.perf_counter()
+    data = await scrape_data(url, logger=logger, config=config)
+    if not data: return None, None
+    telemetry = new_telemetry(data, config)
+    telemetry.record("scrape", time.perf_counter() - start)
+    return data, telemetry
+
+async def run_url(url, config, logger : Logger = Logger(), on_data = None, control : JobControl = None):
+    data, telemetry = await scrape_job(url, config, logger)
+    if not data: return None
+    if on_data:
+        try: await on_data(data)
+        except BaseException:
+            telemetry.close(Logger(None))
+            raise
+    return await download_data(data, config, logger=logger, telemetry=telemetry, control=control)
+
+def job_key(url):
+    m = re.search(r'list\=([^&]+)', url)
+    return m.group(1) if m else url.strip()
+
+def read_urls(lines):
+    urls = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"): urls.append(line)
+    return urls
+
+async def run_batch(urls, config, logger : Logger = Logger(), on_data = None, summary_logger : Logger = None, control : JobControl = None):
+    # metadata for queued jobs is scraped a few jobs ahead while earlier jobs download: a scraped job holds its prefetch
+    # slot until it starts downloading, so at most prefetch_jobs albums (and their covers) wait in memory. a few jobs
+    # download at once so one album's tail overlaps the next, and the global scheduler keeps the combined download budget
+    seen = set()
+    unique = []
+    for url in urls:
+        key = job_key(url)
+        if key in seen:
+            logger.out(f"Skipping duplicate: {url}", LOG_WARNING)
+            continue
+        seen.add(key)
+        unique.append(url)
+
+    logger.out(f"Queued {len(unique)} jobs ({len(urls) - len(unique)} duplicates removed)")
+    results = []
+    start = time.time()
+    prefetch_slots = asyncio.Semaphore(config["prefetch_jobs"])
+    job_slots = asyncio.Semaphore(config["batch_jobs"])
+
+    async def scrape(url):
+        # returns still holding the slot, the job hands it back once it starts
+        await prefetch_slots.acquire()
+        telemetry = None
+        try:
+            data, telemetry = await scrape_job(url, config, logger)
+            if data:
+                with telemetry.span("cover"): await get_album_cover(data["cover"], logger=logger, config=config)
+            return data, telemetry
+        except BaseException:
+            prefetch_slots.release()
+            if telemetry: telemetry.close(Logger(None))
+            raise
+
+    async def run(url, scraped):
+        async with job_slots:
+            job_start = time.time()
+            result = {"url": url, "title": None, "status": "failed", "tracks": 0, "done": 0, "failed": 0, "skipped": 0}
+            try:
+                data, telemetry = await scraped
+                prefetch_slots.release()
+                started.add(url)
+                if data:
+                    result["title"] = f"{data['artist']} - {data['title']}"
+                    if on_data: await on_data(data)
+                    if control: await control.wait()
+                    result.update(await download_data(data, config, logger=logger, telemetry=telemetry, control=control) or {})
+                    result["status"] = "done" if result["failed"] == 0 else "partial"
+            except Exception as e:
+                logger.out(f"Error processing {url}: {e}", LOG_ERROR)
+            result["seconds"] = time.time() - job_start
+            results.append(result)
+
+    started = set()
+    scrapes = [asyncio.create_task(scrape(url)) for url in unique]
+    try:
+        await asyncio.gather(*(run(url, scraped) for url, scraped in zip(unique, scrapes)))
+    finally:
+        for url, scraped in zip(unique, scrapes):
+            scraped.cancel()
+            # scraped ahead but never started (the batch was stopped): its trace still gets closed
+            if url not in started and scraped.done() and not scraped.cancelled() and not scraped.exception():
+                _, telemetry = scraped.result()
+                if telemetry: telemetry.close(Logger(None))
+
+    elapsed = time.time() - start
+    done = sum(r["done"] for r in results)
+    logger = summary_logger or logger
+    logger.out(f"{'=' * 10}\nBATCH SUMMARY")
+    for r in sorted(results, key=lambda r: unique.index(r["url"])):
+        logger.out(f"   [{r['status']}] {r['title'] or r['url']}: {r['done']}/{r['tracks']} downloaded, {r['skipped']} skipped, {r['failed']} failed in {int(r['seconds'])}s")
+    logger.out(f"{len(results)} jobs, {done} tracks in {int(elapsed / 60.0)} minutes and {int(elapsed % 60)} seconds ({done / elapsed * 60 if elapsed else 0:.1f} tracks/min)")
+    return results
+
+# per job settings a client may override when submitting to the daemon
+DAEMON_JOB_OPTIONS = ["out_dir", "audio_format", "job_rate_limit", "track_rate_limit", "playlist_sync", "sync_prune"]
+
+def daemon_job_options(config, options):
+    # a job may pick a folder inside the daemon's out_dir, never one outside it
+    if options is None: options = {}
+    if not isinstance(options, dict): raise ValueError("options must be a json object")
+    options = {k: v for k, v in options.items() if k in DAEMON_JOB_OPTIONS}
+    if "out_dir" in options:
+        root = Path(config["out_dir"]).resolve()
+        out_dir = (root / str(options["out_dir"])).resolve()
+        if out_dir != root and root not in out_dir.parents: raise ValueError(f"out_dir must be inside {root}")
+        options["out_dir"] = str(out_dir)
+    if "audio_format" in options and options["audio_format"] not in AUDIO_FORMATS: raise ValueError(f"unknown audio_format {options['audio_format']}")
+    if "sync_prune" in options and options["sync_prune"] not in ("keep", "delete", "archive"): raise ValueError(f"unknown sync_prune {options['sync_prune']}")
+    return options
+
+def daemon_token(config):
+    # per install secret every api call has to present; it lives in the cache dir, readable by this user only, so only
+    # local clients running as the same user (not web pages the browser talks to 127.0.0.1 for) can use the daemon
+    path = Path(config["cache_dir"]) / "daemon.token"
+    try: return path.read_text(encoding="utf-8").strip()
+    except FileNotFoundError: pass
+    import secrets
+    path.parent.mkdir(parents=True, exist_ok=True)
+    token = secrets.token_urlsafe(32)
+    try: fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError: return path.read_text(encoding="utf-8").strip()
+    with os.fdopen(fd, "w", encoding="utf-8") as f: f.write(token)
+    return token
+
+class Daemon():
+    # one long running process shared by every client, so caches, connection pools, the ytmusic clients, the scheduler
+    # and the bandwidth budget stay warm between jobs. queued jobs start highest priority first, batch_jobs at a time.
+    # the api calls in from its own threads; anything that touches tasks is handed to the loop
+    def __init__(self, config, logger : Logger = Logger()):
         self.config = config
-        self.setup_ui()
-
-    def setup_ui(self):
-        main_layout = QHBoxLayout(self)
-
-        left_widget = QWidget()
-        left_layout = QVBoxLayout(left_widget)
-        left_layout.setContentsMargins(0, 0, 0, 0)
-
-        form_layout = QFormLayout()
-
-        #url
-        self.url_input = QLineEdit()
-        self.url_input.setPlaceholderText("Paste URL here...")
-        self.btn_fetch_data = QPushButton("Fetch Data")
-        self.btn_fetch_data.setFixedWidth(80)
-        self.btn_fetch_data.clicked.connect(lambda: self.fetch_data())
-        url_layout = QHBoxLayout()
-        url_layout.addWidget(self.url_input)
-        url_layout.addWidget(self.btn_fetch_data)
-        form_layout.addRow("URL:", url_layout)
-
-        #out path
-        self.out_input = QLineEdit(self.config["out_dir"])
-        self.btn_browse_out = QPushButton("...")
-        self.btn_browse_out.setFixedWidth(30)
-        self.btn_browse_out.clicked.connect(lambda: self.browse_folder(self.out_input))
-        out_layout = QHBoxLayout()
-        out_layout.addWidget(self.out_input)
-        out_layout.addWidget(self.btn_browse_out)
-        form_layout.addRow("Output Path:", out_layout)
-
-        #temp path
-        self.temp_input = QLineEdit(self.config["temp_dir"])
-        self.btn_browse_temp = QPushButton("...")
-        self.btn_browse_temp.setFixedWidth(30)
-        self.btn_browse_temp.clicked.connect(lambda: self.browse_folder(self.temp_input))
-        temp_layout = QHBoxLayout()
-        temp_layout.addWidget(self.temp_input)
-        temp_layout.addWidget(self.btn_browse_temp)
-        form_layout.addRow("Temp Path:", temp_layout)
-
-        #cover path
-        self.cover_input = QLineEdit(self.config["cover_dir"])
-        self.btn_browse_cover = QPushButton("...")
-        self.btn_browse_cover.setFixedWidth(30)
-        self.btn_browse_cover.clicked.connect(lambda: self.browse_folder(self.cover_input))
-        cover_layout = QHBoxLayout()
-        cover_layout.addWidget(self.cover_input)
-        cover_layout.addWidget(self.btn_browse_cover)
-        form_layout.addRow("Cover Path:", cover_layout)
-
-        #threads
-        self.num_threads_input = QSpinBox()
-        self.num_threads_input.setRange(1, 128)
-        self.num_threads_input.setValue(int(self.config.get("max_threads", 4)))
-        self.num_threads_input.setFixedWidth(100)
-        form_layout.addRow("Max Threads:", self.num_threads_input)
-
-        left_layout.addLayout(form_layout)
-
-        #start button
-        self.start_btn = QPushButton("Start Download")
-        self.start_btn.setMinimumHeight(40)
-        self.start_btn.clicked.connect(self.start_process)
-        left_layout.addWidget(self.start_btn)
-
-        #console
-        self.console_label = QLabel("Console Output:")
-        left_layout.addWidget(self.console_label)
-        self.console = QTextEdit()
-        self.console.setReadOnly(True)
-        self.console.setStyleSheet("background-color: #222; color: #EEE; font-family: Consolas, monospace;")
-        left_layout.addWidget(self.console)
-
-        right_widget = QWidget()
-        right_widget.setFixedWidth(320)
-        right_layout = QVBoxLayout(right_widget)
-        right_layout.setContentsMargins(10, 0, 0, 0)
-
-        #cover image
-        self.cover_label = QLabel()
-        self.cover_label.setFixedSize(300, 300)
-        self.cover_label.setStyleSheet("background-color: #333; border: 1px solid #555;")
-        self.cover_label.setAlignment(Qt.AlignCenter)
-        self.cover_label.setText("No Cover")
-        right_layout.addWidget(self.cover_label)
-
-        self.info_console = QTextEdit()
-        self.info_console.setReadOnly(True)
-        self.info_console.setStyleSheet("background-color: #222; color: #EEE; font-family: Consolas, monospace;")
-        self.info_console.setFixedWidth(300)
-        right_layout.addWidget(self.info_console, 1)
-        
-        right_layout.addStretch()
-
-        main_layout.addWidget(left_widget, 1) 
-        main_layout.addWidget(right_widget, 0)
-
-    def browse_folder(self, line_edit):
-        folder = QFileDialog.getExistingDirectory(self, "Select Directory", line_edit.text())
-        if folder:
-            line_edit.setText(folder)
-
-    def log_to_console(self, text):
-        self.console.append(text)
-        sb = self.console.verticalScrollBar()
-        sb.setValue(sb.maximum())
-
-    def update_info_panel(self, data, cover_data):
-        style_key = "font-weight: bold; color: #FFD700;" 
-        style_val = "color: #FFFFFF;"
-        
-        track_list_html = "<br>".join(
-            f"<span style='font-weight: bold; color: #FFFFFF;'>{track['trackNumber']}. </span>"
-            f"<span style='color: #FFFFFF;'>{track['title']}</span>"
-            for track in data["tracks"]
-    ) if data["type"] != "playlist" else "<br>".join(
-            f"<span style='color: #FFFFFF;'>{track['title']}</span>"
-            for track in data["tracks"]
-    )
-
-        indented_tracks = f"<div style='margin-left: 1em;'>{track_list_html}</div>"
-
-        info_text = (
-            f"<span style='{style_key}'>Title:</span> <span style='{style_val}'>{data.get('title', 'Unknown')}</span><br>"
-            f"<span style='{style_key}'>Artist:</span> <span style='{style_val}'>{data.get('artist', 'Unknown')}</span><br>"
-            f"<span style='{style_key}'>Year:</span> <span style='{style_val}'>{data.get('year', 'Unknown')}</span><br>"
-            f"<span style='{style_key}'>Type:</span> <span style='{style_val}'>{data.get('type', 'Unknown').capitalize()}</span><br>"
-            f"<span style='{style_key}'>Tracks:</span> <span style='{style_val}'>{data.get('trackcount', 0)}</span>"
-            f"{indented_tracks}"
-        )
-        
-        self.info_console.setHtml(info_text)
-        sb = self.console.verticalScrollBar()
-        sb.setValue(sb.minimum())
-
-        if cover_data:
-            pixmap = QPixmap()
-            pixmap.loadFromData(cover_data)
-            self.cover_label.setPixmap(pixmap.scaled(300, 300, Qt.KeepAspectRatio, Qt.SmoothTransformation))
-        else:
-            self.cover_label.setText("No Cover Found")
-    
-    def fetch_data(self):
-        url = self.url_input.text().strip()
-        if not url:
-            self.log_to_console("Error: Please enter a URL.")
-            return
-        
-        self.btn_fetch_data.setEnabled(False)
-        self.console.clear()
-        
-        self.worker = Worker(url, config, data_only=True)
-        self.worker.log_signal.connect(self.log_to_console)
-        self.worker.data_signal.connect(self.update_info_panel)
-        self.worker.finished_signal.connect(self.on_finished)
-        self.worker.start()
-
-    def start_process(self):
-        url = self.url_input.text().strip()
-        if not url:
-            self.log_to_console("Error: Please enter a URL.")
-            return
-
-        config = self.config.copy()
-        config["out_dir"] = self.out_input.text()
-        config["temp_dir"] = self.temp_input.text()
-        config["cover_dir"] = self.cover_input.text()
-        config["max_threads"] = self.num_threads_input.value()
-
-        self.btn_fetch_data.setEnabled(False)
-
-        self.start_btn.setEnabled(False)
-        self.start_btn.setText("Downloading...")
-        self.console.clear()
-
-        self.cover_label.clear()
-        self.cover_label.setText("Loading...")
-
-        self.worker = Worker(url, config)
-        self.worker.log_signal.connect(self.log_to_console)
-        self.worker.data_signal.connect(self.update_info_panel)
-        self.worker.finished_signal.connect(self.on_finished)
-        self.worker.start()
-
-    def on_finished(self):
-        self.btn_fetch_data.setEnabled(True)
-        self.start_btn.setEnabled(True)
-        self.start_btn.setText("Start Download")
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        self.running = 0
+        self.closing = False
+        self.loop = None
+
+    def submit(self, url, priority = 0, options = None):
+        key = job_key(url)
+        options = daemon_job_options(self.config, options)
+        with self.lock:
+            # checked and inserted under one lock, so two clients submitting the same url at once get the same job
+            existing = [job for job in self.jobs.values() if job["key"] == key and job["status"] in ("queued", "running")]
+            if not existing: job = self.new_job(url, key, priority, options)
+        if existing: return self.public(existing[0])
+        self.logger.out(f"Job {job['id']} queued: {url}")
+        self.loop.call_soon_threadsafe(self.dispatch)
+        return self.public(job)
+
+    def new_job(self, url, key, priority, options):
+        # caller holds the lock
+        job_id = next(self.ids)
+        log = deque(maxlen=1000)
+        job = {
+            "id": job_id, "url": url, "key": key, "priority": priority, "status": "queued", "title": None, "result": None, "error": None,
+            "submitted": time.time(), "started": None, "finished": None,
+            "options": options,
+            "control": JobControl(), "log": log, "log_count": 0, "task": None,
+        }
+        def out(s):
+            log.append(s)
+            job["log_count"] += 1
+        job["logger"] = Logger(out, parse_log_level(self.config["log_level"]))
+        self.jobs[job_id] = job
+        return job
+
+    def get(self, job_id):
+        with self.lock: return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None: return None
+        with self.lock:
+            if job["status"] == "queued":
+                job["status"], job["finished"] = "cancelled", time.time()
+            elif job["status"] == "running":
+                job["control"].resume()
+                self.loop.call_soon_threadsafe(job["task"].cancel)
+        return self.public(job)
+
+    def set_priority(self, job_id, priority):
+        job = self.get(job_id)
+        if job is None: return None
+        with self.lock: job["priority"] = priority
+        self.loop.call_soon_threadsafe(self.dispatch)
+        return self.public(job)
+
+    def set_paused(self, job_id, paused):
+        job = self.get(job_id)
+        if job is None: return None
+        if paused: job["control"].pause()
+        else: job["control"].resume()
+        return self.public(job)
+
+    def public(self, job, since = None):
+        # the job list leaves out the track listing, a single job's state has it once the job is scraped
+        with self.lock:
+            state = {k: v for k, v in job.items() if k not in ("key", "control", "log", "log_count", "logger", "task", "info")}
+            if since is not None:
+                state["info"] = job.get("info")
+                # the last lines from `since` on, as far as the ring still has them
+                first = job["log_count"] - len(job["log"])
+                state["log"] = list(job["log"])[max(0, since - first):]
+                state["log_next"] = job["log_count"]
+        if since is not None: state["progress"] = job["control"].snapshot()
+        return state
+
+    def list(self):
+        with self.lock: jobs = list(self.jobs.values())
+        return [self.public(job) for job in jobs]
+
+    def dispatch(self):
+        # loop thread only
+        while not self.closing and self.running < self.config["batch_jobs"]:
+            with self.lock:
+                queued = [job for job in self.jobs.values() if job["status"] == "queued"]
+                if not queued: return
+                job = max(queued, key=lambda job: (job["priority"], -job["id"]))
+                job["status"], job["started"] = "running", time.time()
+                job["task"] = asyncio.create_task(self.run_job(job))
+            self.running += 1
+
+    async def run_job(self, job):
+        config = dict(self.config, **job["options"])
+        self.logger.out(f"Job {job['id']} started: {job['url']}")
+        status, result, error = "failed", None, None
+        try:
+            data, telemetry = await scrape_job(job["url"], config, job["logger"])
+            if data:
+                info = {k: data.get(k) for k in ("type", "title", "artist", "year", "trackcount", "cover")}
+                info["tracks"] = [{"title": track["title"], "trackNumber": track.get("trackNumber")} for track in data["tracks"]]
+                with self.lock: job.update(title=f"{data['artist']} - {data['title']}", info=info)
+                result = await download_data(data, config, logger=job["logger"], telemetry=telemetry, control=job["control"]) or {}
+                status = "done" if result.get("failed", 0) == 0 else "partial"
+        except asyncio.CancelledError:
+            status = "cancelled"
+        except Exception as e:
+            error = str(e)
+            job["logger"].out(f"Error processing {job['url']}: {e}", LOG_ERROR)
+        with self.lock: job.update(status=status, result=result, error=error, finished=time.time(), task=None)
+        self.logger.out(f"Job {job['id']} {status}: {job['title'] or job['url']}")
+        self.running -= 1
+        self.dispatch()
+
+    async def serve(self, port):
+        self.loop = asyncio.get_running_loop()
+        server = start_daemon_server(self, port, daemon_token(self.config), self.logger)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self.closing = True
+            server.shutdown()
+            tasks = [job["task"] for job in self.jobs.values() if job["task"]]
+            for task in tasks: task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+def start_daemon_server(daemon : Daemon, port, token, logger : Logger = Logger()):
+    # GET /jobs, POST /jobs {"url", "priority", "options"}, GET /jobs/<id>?since=<log line>, DELETE /jobs/<id>,
+    # PATCH /jobs/<id> {"priority", "paused"}; localhost only. every request needs "Authorization: Bearer <daemon_token>", bodies
+    # must be json and browser requests from other origins are refused, so a web page can't submit jobs
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    origins = {f"http://127.0.0.1:{port}", f"http://localhost:{port}"}
+    authorization = f"Bearer {token}".encode()
+
+    class DaemonHandler(BaseHTTPRequestHandler):
+        def route(self, method):
+            origin = self.headers.get("Origin")
+            if origin and origin not in origins: return self.reply(403, {"error": "cross-origin requests are not accepted"})
+            if not hmac.compare_digest(self.headers.get("Authorization", "").encode(errors="replace"), authorization):
+                return self.reply(401, {"error": "missing or wrong daemon token"})
+            if method in ("POST", "PATCH") and self.headers.get("Content-Type", "").split(";")[0].strip().lower() != "application/json":
+                return self.reply(415, {"error": "Content-Type must be application/json"})
+            url = urlparse(self.path)
+            parts = [p for p in url.path.split("/") if p]
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                if not isinstance(body, dict): return self.reply(400, {"error": "body must be a json object"})
+                if parts == ["jobs"] and method == "GET": return self.reply(200, daemon.list())
+                if parts == ["jobs"] and method == "POST":
+                    if not body.get("url") or not isinstance(body["url"], str): return self.reply(400, {"error": "url is required"})
+                    if body.get("options") is not None and not isinstance(body["options"], dict): return self.reply(400, {"error": "options must be a json object"})
+                    return self.reply(201, daemon.submit(body["url"], int(body.get("priority", 0)), body.get("options")))
+                if len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit():
+                    job_id = int(parts[1])
+                    job = daemon.get(job_id)
+                    if job is None: return self.reply(404, {"error": f"no job {job_id}"})
+                    if method == "GET":
+                        since = re.search(r'since=(\d+)', url.query)
+                        return self.reply(200, daemon.public(job, int(since.group(1)) if since else 0))
+                    if method == "DELETE": return self.reply(200, daemon.cancel(job_id))
+                    if method == "PATCH":
+                        if "priority" not in body and "paused" not in body: raise KeyError("priority")
+                        if "paused" in body: job = daemon.set_paused(job_id, bool(body["paused"]))
+                        if "priority" in body: job = daemon.set_priority(job_id, int(body["priority"]))
+                        return self.reply(200, job)
+                self.reply(404, {"error": "not found"})
+            except (ValueError, KeyError, TypeError) as e:
+                self.reply(400, {"error": str(e)})
+
+        def reply(self, code, obj):
+            body = json.dumps(obj).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self): self.route("GET")
+        def do_POST(self): self.route("POST")
+        def do_PATCH(self): self.route("PATCH")
+        def do_DELETE(self): self.route("DELETE")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), DaemonHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.out(f"Accepting jobs on http://127.0.0.1:{port}/jobs")
+    return server
+
+def daemon_request(config, method, path, body = None, timeout = 10):
+    # thin client side; urllib keeps it free of the heavier imports
+    import urllib.error
+    import urllib.request
+    request = urllib.request.Request(f"http://127.0.0.1:{config['daemon_port']}{path}", method=method,
+        data=json.dumps(body).encode() if body is not None else None,
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {daemon_token(config)}"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response: return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(json.loads(e.read() or b"{}").get("error", str(e)))
+
+def daemon_running(config):
+    # only a daemon that accepts our token counts; nothing listening, another program on the port or a stale token is a no
+    if not (Path(config["cache_dir"]) / "daemon.token").exists(): return False
+    try: daemon_request(config, "GET", "/jobs", timeout=2)
+    except (OSError, RuntimeError, ValueError): return False
+    return True
+
+def follow_jobs(config, job_ids, logger : Logger = Logger(), on_progress = None, interval = 1.0):
+    # polls the daemon until every job has ended, streaming their log lines; returns the final job states
+    since = {job_id: 0 for job_id in job_ids}
+    finished = {}
+    while len(finished) < len(job_ids):
+        for job_id in job_ids:
+            if job_id in finished: continue
+            job = daemon_request(config, "GET", f"/jobs/{job_id}?since={since[job_id]}")
+            for line in job["log"]: logger.out(line)
+            since[job_id] = job["log_next"]
+            if job["status"] not in ("queued", "running"): finished[job_id] = job
+            elif on_progress: on_progress(job)
+        if len(finished) < len(job_ids): time.sleep(interval)
+    return [finished[job_id] for job_id in job_ids]
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         prog="Album and Playlist Downloader",
         description="Scrapes Album and Playlist data from youtube music, and stores it in catgorized folders"
     )
-    parser.add_argument("ytb_url", nargs="?", help="The youtube music URL")
-    parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument("ytb_url", nargs="*", help="One or more youtube music URLs")
+    parser.add_argument("-i", "--input", help="Read URLs from a file, one per line ('-' for stdin)")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="-v prints the log at log_level (default info), -vv prints everything")
+    parser.add_argument("--engine", choices=list(DOWNLOAD_ENGINES), help="Download engine to use (default: library)")
+    parser.add_argument("--format", dest="audio_format", choices=list(AUDIO_FORMATS), help="mp3 re-encodes every track, native keeps the original Opus/AAC stream")
+    parser.add_argument("--cache-only", action="store_true", help="Only use cached metadata, never query YouTube Music")
+    parser.add_argument("--trace", metavar="DIR", help="Write per track and per stage timings as JSON lines to DIR")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on 127.0.0.1:PORT/metrics")
+    parser.add_argument("--progress", action="store_true", help="Show a live progress line on stderr")
+    parser.add_argument("--limit-rate", metavar="RATE", help="Global download budget in bytes/s, e.g. 2M (0 for unlimited)")
+    parser.add_argument("--job-limit-rate", metavar="RATE", help="Download cap per album or playlist, e.g. 1M")
+    parser.add_argument("--track-limit-rate", metavar="RATE", help="Download cap per track, e.g. 256K")
+    parser.add_argument("--rate-schedule", metavar="SCHEDULE", help='Time of day global budgets, e.g. "01:00-07:00=0, 07:00-23:00=2M"')
+    parser.add_argument("--sync", action="store_true", help="Playlists: only download tracks added since the last run")
+    parser.add_argument("--prune", choices=["keep", "delete", "archive"], help="With --sync, what happens to files of tracks removed from the playlist (default: keep)")
+    parser.add_argument("--daemon", action="store_true", help="Run as a long lived service accepting jobs on 127.0.0.1:--port")
+    parser.add_argument("--port", type=int, help="Daemon port (default: daemon_port from the config, 8765)")
+    parser.add_argument("--remote", action="store_true", help="Submit the URLs to a running daemon and follow them until they finish")
+    parser.add_argument("--detach", action="store_true", help="With --remote, only submit and print the job ids")
+    parser.add_argument("--priority", type=int, default=0, help="Priority of submitted jobs, higher starts first")
+    parser.add_argument("--jobs", action="store_true", help="List the daemon's jobs")
+    parser.add_argument("--cancel", type=int, nargs="+", metavar="ID", help="Cancel daemon jobs")
+    parser.add_argument("--set-priority", type=int, nargs=2, metavar=("ID", "PRIORITY"), help="Change the priority of a queued daemon job")
     args = parser.parse_args()
+    pin_mmap_threshold()
 
     config = load_config()
+    if args.engine: config["engine"] = args.engine
+    if args.audio_format: config["audio_format"] = args.audio_format
+    if args.cache_only: config["cache_only"] = True
+    if args.trace: config["trace_dir"] = args.trace
+    if args.limit_rate: config["rate_limit"] = args.limit_rate
+    if args.job_limit_rate: config["job_rate_limit"] = args.job_limit_rate
+    if args.track_limit_rate: config["track_rate_limit"] = args.track_limit_rate
+    if args.rate_schedule: config["rate_schedule"] = args.rate_schedule
+    if args.sync: config["playlist_sync"] = True
+    if args.prune: config["sync_prune"] = args.prune
+    if args.port: config["daemon_port"] = args.port
+    if args.metrics_port: start_metrics_server(args.metrics_port)
+
+    if args.daemon:
+        daemon = Daemon(config, Logger(print, LOG_DEBUG if args.verbose > 1 else parse_log_level(config["log_level"])))
+        try: asyncio.run(daemon.serve(config["daemon_port"]))
+        except KeyboardInterrupt: pass
+        sys.exit(0)
+
+    if args.jobs or args.cancel or args.set_priority:
+        try:
+            if args.set_priority: daemon_request(config, "PATCH", f"/jobs/{args.set_priority[0]}", {"priority": args.set_priority[1]})
+            for job_id in args.cancel or []: daemon_request(config, "DELETE", f"/jobs/{job_id}")
+            for job in daemon_request(config, "GET", "/jobs"):
+                print(f"{job['id']:>5} [{job['status']}] p{job['priority']} {job['title'] or job['url']}")
+        except (OSError, RuntimeError) as e:
+            sys.exit(f"Daemon error: {e}")
+        sys.exit(0)
+
+    urls = list(args.ytb_url)
+    if args.input:
+        if args.input == "-": urls += read_urls(sys.stdin)
+        else:
+            with open(args.input, "r", encoding="utf-8") as f: urls += read_urls(f)
 
-    if args.ytb_url:
-        logger = Logger(print if args.verbose else None)
-        data = scrape_data(args.ytb_url, logger=logger)
-        if data:
-            if args.verbose: print(f"Downloading: {data["artist"]} - {data["album"]}...")
-            download_album(data, config, logger=logger)
+    control = JobControl(on_progress=lambda snapshot: print(f"\r{format_progress(snapshot)}\033[K", end="", file=sys.stderr, flush=True)) if args.progress else None
+
+    if args.remote:
+        options = {k: config[k] for k, arg in [("audio_format", "audio_format"), ("job_rate_limit", "job_rate_limit"), ("track_rate_limit", "track_rate_limit"), ("playlist_sync", "sync"), ("sync_prune", "prune")] if getattr(args, arg, None)}
+        try:
+            jobs = [daemon_request(config, "POST", "/jobs", {"url": url, "priority": args.priority, "options": options}) for url in urls]
+            for job in jobs: print(f"Job {job['id']} [{job['status']}]: {job['url']}")
+            if args.detach: sys.exit(0)
+            logger = Logger(print if args.verbose else None)
+            on_progress = (lambda job: control.on_progress(job["progress"])) if control else None
+            jobs = follow_jobs(config, [job["id"] for job in jobs], logger, on_progress)
+        except (OSError, RuntimeError) as e:
+            sys.exit(f"Daemon error: {e}")
+        for job in jobs:
+            result = job["result"] or {}
+            print(f"   [{job['status']}] {job['title'] or job['url']}: {result.get('done', 0)}/{result.get('tracks', 0)} downloaded, {result.get('skipped', 0)} skipped, {result.get('failed', 0)} failed")
+        sys.exit(0 if all(job["status"] == "done" for job in jobs) else 1)
+
+    if len(urls) > 1 or args.input:
+        logger = Logger(print if args.verbose else None, LOG_DEBUG if args.verbose > 1 else parse_log_level(config["log_level"]))
+        results = asyncio.run(run_batch(urls, config, logger=logger, summary_logger=Logger(print), control=control))
+        sys.exit(0 if all(r["status"] == "done" for r in results) else 1)
+    elif urls:
+        logger = Logger(print if args.verbose else None, LOG_DEBUG if args.verbose > 1 else parse_log_level(config["log_level"]))
+
+        async def announce(data):
+            if args.verbose: print(f"Downloading: {data['artist']} - {data['title']}...")
+
+        if asyncio.run(run_url(urls[0], config, logger, on_data=announce, control=control)) is not None:
             if args.verbose: print(f"Download Finished!")
     else:
-        if os.name == 'nt':
-            myappid = 'music.downloader.gui.v1'
-            ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
-        app = QApplication(sys.argv)
-        if os.path.exists("MusicDownloader.ico"):
-            app.setWindowIcon(QIcon("MusicDownloader.ico"))
-        window = MusicDownloaderGUI(config)
-        window.show()
-        sys.exit(app.exec())
\ No newline at end of file
+        # gui.py imports this module by name; point that at the running script instead of loading a second copy
+        sys.modules.setdefault("MusicDownloader", sys.modules[__name__])
+        from gui import run_gui
+        sys.exit(run_gui(config))
\ No newline at end of file
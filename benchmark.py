@@ -0,0 +1,535 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def peak_rss_kb(children = False):
+    if not resource: return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    return usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+
+def make_audio(path : Path, seconds = 30, codec = "aac"):
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg: sys.exit("ffmpeg is required to generate the benchmark audio")
+    subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}", "-c:a", codec, "-b:a", "128k", str(path)], check=True)
+    return path
+
+def cpu_seconds():
+    # our own CPU time plus every finished child (ffmpeg) process
+    own = time.process_time()
+    if not resource: return own
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own + usage.ru_utime + usage.ru_stime
+
+class FakeExtractor(BaseHTTPRequestHandler):
+    # every /<videoId>.m4a resolves to the same generated file, yt-dlp picks it up through its generic extractor
+    audio = b""
+    latency = 0.0
+
+    def do_HEAD(self):
+        self.send_headers()
+
+    def do_GET(self):
+        self.send_headers()
+        self.wfile.write(self.audio)
+
+    def send_headers(self):
+        if self.latency: time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mp4")
+        self.send_header("Content-Length", str(len(self.audio)))
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+class FakeYTMusic(BaseHTTPRequestHandler):
+    # stands in for the YouTube Music api: GET /<method>/<id> answers with a recorded response from `fixtures`
+    # (<method>/<id>.json, see the record command) or a synthetic one. MPREb_<name>_<n> is an album of n tracks,
+    # OLAK5uy_<name>_<n> its audio playlist and PL<name>_<n> a playlist of n tracks spread over 10 track albums.
+    # every thumbnail points back here, at /cover/
+    fixtures = None
+    cover = b""
+    track_seconds = 30
+
+    def do_GET(self):
+        parts = urllib.parse.unquote(self.path).strip("/").split("/")
+        if parts[0] == "cover":
+            return self.reply(self.cover, "image/jpeg")
+        if len(parts) != 2: return self.send_error(404)
+        method, key = parts
+        recorded = Path(self.fixtures or "") / method / f"{key}.json"
+        if self.fixtures and recorded.exists(): data = json.loads(recorded.read_text(encoding="utf-8"))
+        elif method == "get_album_browse_id": data = key.replace("OLAK5uy_", "MPREb_", 1)
+        elif method == "get_album": data = self.album(key)
+        elif method == "get_playlist": data = self.playlist(key)
+        else: return self.send_error(404)
+        self.reply(json.dumps(self.local_thumbnails(data, key)).encode(), "application/json")
+
+    def album(self, album_id):
+        n = int(album_id.rsplit("_", 1)[-1])
+        return {
+            "title": album_id, "artists": [{"name": "Benchmark"}], "year": 2000, "type": "Album", "trackCount": n,
+            "thumbnails": [{"url": "w60-h60"}],
+            "tracks": [{"videoId": f"v{album_id}t{i}", "title": f"Track {i + 1}", "artists": [{"name": "Benchmark"}], "trackNumber": i + 1, "duration_seconds": self.track_seconds} for i in range(n)],
+        }
+
+    def playlist(self, playlist_id):
+        n = int(playlist_id.rsplit("_", 1)[-1])
+        tracks = []
+        for i in range(n):
+            album_id = f"MPREb_{playlist_id}a{i // 10}_10"
+            tracks.append({"videoId": f"v{album_id}t{i % 10}", "title": f"Track {i % 10 + 1}", "artists": [{"name": "Benchmark"}], "album": {"id": album_id, "name": album_id},
+                "duration_seconds": self.track_seconds, "thumbnails": [{"url": "w60-h60"}]})
+        return {"title": playlist_id, "author": {"name": "Benchmark"}, "year": 2000, "trackCount": n, "thumbnails": [{"url": "=s60"}], "tracks": tracks}
+
+    def local_thumbnails(self, data, key):
+        base = f"http://{self.headers.get('Host')}/cover/{key}"
+        if isinstance(data, dict):
+            return {k: [dict(t, url=f"{base}-{i}-w60-h60=s60") for i, t in enumerate(v)] if k == "thumbnails" else self.local_thumbnails(v, key) for k, v in data.items()}
+        if isinstance(data, list): return [self.local_thumbnails(v, key) for v in data]
+        return data
+
+    def reply(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class FakeYTMusicClient():
+    # what get_yt hands out during a pipeline benchmark, so fetch_metadata keeps its throttling and worker threads
+    def __init__(self, base, session):
+        self.base = base
+        self.session = session
+
+    def get(self, method, key):
+        r = self.session.get(f"{self.base}/{method}/{urllib.parse.quote(key)}")
+        r.raise_for_status()
+        return r.json()
+
+    def get_album(self, browseId):
+        return self.get("get_album", browseId)
+
+    def get_album_browse_id(self, audioPlaylistId):
+        return self.get("get_album_browse_id", audioPlaylistId)
+
+    def get_playlist(self, playlistId, limit = 100):
+        return self.get("get_playlist", playlistId)
+
+class StubEngine():
+    # stands in for yt-dlp: after `latency` seconds writes the benchmark audio in chunks, reporting progress and
+    # drawing on the bandwidth share the way the library engine does
+    name = "stub"
+    audio_path = None
+    latency = 0.0
+    chunk = 256 * 1024
+
+    def __init__(self, config):
+        self.audio = Path(self.audio_path).read_bytes()
+
+    async def download(self, url, temp_path : Path, name : str, logger = None, format = None, progress = None, share = None):
+        await asyncio.sleep(self.latency)
+        path = Path(temp_path) / f"{name}{Path(self.audio_path).suffix}"
+
+        def write():
+            with open(path, "wb") as f:
+                for offset in range(0, len(self.audio), self.chunk):
+                    block = self.audio[offset:offset + self.chunk]
+                    f.write(block)
+                    if share: share.consume(len(block))
+                    if progress: progress(offset + len(block), len(self.audio))
+        await asyncio.to_thread(write)
+        return path
+
+FAKE_FFMPEG = """import shutil, sys
+# copies the audio input to the output, enough for the pipeline to run without a real ffmpeg
+args = sys.argv[1:]
+shutil.copyfile(args[args.index("-i") + 1], args[-1])
+"""
+
+def make_fake_ffmpeg(directory : Path):
+    (directory / "fake_ffmpeg.py").write_text(FAKE_FFMPEG)
+    if os.name == "nt":
+        (directory / "ffmpeg.bat").write_text(f'@"{sys.executable}" "%~dp0fake_ffmpeg.py" %*\n')
+    else:
+        script = directory / "ffmpeg"
+        script.write_text(f"#!{sys.executable}\n" + FAKE_FFMPEG)
+        script.chmod(0o755)
+    return directory
+
+def make_cover(path : Path, size = 1200):
+    from PIL import Image
+    Image.effect_noise((size, size), 48).convert("RGB").save(path, format="JPEG", quality=90)
+    return path
+
+def start_server(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def bench_config(engine, temp_dir):
+    import MusicDownloader as md
+    config = md.load_config()
+    config["engine"] = engine
+    config["temp_dir"] = str(temp_dir)
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg: config["ffmpeg_dir"] = os.path.dirname(ffmpeg)
+    if not os.path.exists(config["yt_dlp_path"]): config["yt_dlp_path"] = [sys.executable, "-m", "yt_dlp"]
+    return config
+
+def run_engine(args):
+    import MusicDownloader as md
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        config = bench_config(args.engine, temp_path)
+        engine = md.get_download_engine(config, md.Logger(None))
+        times = []
+        slots = asyncio.Semaphore(args.threads)
+
+        async def one(i):
+            async with slots:
+                start = time.perf_counter()
+                await engine.download(f"{args.url_base}/track{i}.m4a", temp_path, f"track{i}")
+                times.append(time.perf_counter() - start)
+
+        async def run():
+            await asyncio.gather(*(one(i) for i in range(args.tracks)))
+
+        start = time.perf_counter()
+        asyncio.run(run())
+        wall = time.perf_counter() - start
+
+    rss = [r for r in [peak_rss_kb(), peak_rss_kb(children=True)] if r is not None]
+    print(json.dumps({
+        "engine": args.engine,
+        "tracks": args.tracks,
+        "wall_s": round(wall, 3),
+        "per_track_s": round(sum(times) / max(len(times), 1), 3),
+        "peak_rss_kb": max(rss) if rss else None,
+    }))
+
+def bench_engines(args):
+    with tempfile.TemporaryDirectory() as audio_dir:
+        FakeExtractor.audio = make_audio(Path(audio_dir) / "track.m4a", args.seconds).read_bytes()
+        FakeExtractor.latency = args.latency
+        server = start_server(FakeExtractor)
+        url_base = f"http://127.0.0.1:{server.server_address[1]}"
+
+        results = []
+        for engine in args.engines:
+            cmd = [sys.executable, __file__, "_engine", engine, "--url-base", url_base, "--tracks", str(args.tracks), "--threads", str(args.threads)]
+            out = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            if out.returncode != 0:
+                print(f"{engine}: failed\n{out.stderr}")
+                continue
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        server.shutdown()
+
+    print(f"{'engine':<12}{'wall s':>10}{'per track s':>14}{'peak rss MB':>14}")
+    for r in results:
+        rss = f"{r['peak_rss_kb'] / 1024:.1f}" if r["peak_rss_kb"] else "n/a"
+        print(f"{r['engine']:<12}{r['wall_s']:>10}{r['per_track_s']:>14}{rss:>14}")
+    return results
+
+def bench_formats(args):
+    import MusicDownloader as md
+    logger = md.Logger(None)
+
+    async def encode(job):
+        return await md.tag_track(await md.transcode_track(job))
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        sources = {
+            "opus": make_audio(temp_path / "source.webm", args.seconds, "libopus"),
+            "aac": make_audio(temp_path / "source.m4a", args.seconds, "aac"),
+        }
+        for source, source_path in sources.items():
+            for audio_format in args.formats:
+                config = bench_config("library", temp_path)
+                config["audio_format"] = audio_format
+                config["out_dir"] = str(temp_path / "out")
+                data = {"title": "Benchmark", "artist": "Benchmark", "year": 2000}
+                start_cpu, start = cpu_seconds(), time.perf_counter()
+                for i in range(args.tracks):
+                    track = {"videoId": f"track{i}", "title": f"Track {i}", "artists": ["Benchmark"], "trackNumber": i + 1}
+                    job = md.new_track_job(track, data, config, None, logger)
+                    job["raw_file_path"] = temp_path / f"track{i}{source_path.suffix}"
+                    shutil.copyfile(source_path, job["raw_file_path"])
+                    asyncio.run(encode(job))
+                    job["temp_file_path"].unlink()
+                cpu, wall = cpu_seconds() - start_cpu, time.perf_counter() - start
+                results.append({"source": source, "format": audio_format, "cpu_s_per_album": round(cpu, 3), "wall_s": round(wall, 3)})
+
+    print(f"{'source':<8}{'format':<10}{'cpu s/album':>14}{'wall s':>10}")
+    for r in results:
+        print(f"{r['source']:<8}{r['format']:<10}{r['cpu_s_per_album']:>14}{r['wall_s']:>10}")
+    return results
+
+def pipeline_url(kind, tracks):
+    return {
+        "album": f"https://music.youtube.com/playlist?list=OLAK5uy_bench{tracks}_{tracks}",
+        "playlist": f"https://music.youtube.com/playlist?list=PLbench{tracks}_{tracks}",
+    }[kind]
+
+def run_pipeline(args):
+    import MusicDownloader as md
+    md.pin_mmap_threshold()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        config = bench_config("stub", temp_path / "temp")
+        StubEngine.audio_path, StubEngine.latency = args.audio, args.latency
+        md.DOWNLOAD_ENGINES["stub"] = StubEngine
+        md.get_yt = lambda config: FakeYTMusicClient(args.api, md.get_http_session(config))
+        config.update(out_dir=str(temp_path / "out"), cover_dir=str(temp_path / "covers"), cache_dir=str(temp_path / "cache"),
+            trace_dir=str(temp_path / "trace"), max_threads=args.threads, audio_format=args.format)
+        if args.ffmpeg_dir: config["ffmpeg_dir"] = args.ffmpeg_dir
+
+        start_cpu, start = cpu_seconds(), time.perf_counter()
+        result = asyncio.run(md.run_url(args.url, config, md.Logger(None))) or {}
+        cpu, wall = cpu_seconds() - start_cpu, time.perf_counter() - start
+
+        # a track's latency is the sum of its stage and queue times in the trace
+        latency = {}
+        for trace in (temp_path / "trace").glob("*.jsonl"):
+            for line in trace.read_text(encoding="utf-8").splitlines():
+                event = json.loads(line)
+                if event.get("track") and event.get("stage"): latency[event["track"]] = latency.get(event["track"], 0.0) + event["seconds"]
+    latencies = list(latency.values())
+    print(json.dumps({
+        "tracks": result.get("tracks", 0),
+        "done": result.get("done", 0),
+        "wall_s": round(wall, 3),
+        "tracks_per_s": round(result.get("done", 0) / wall, 3) if wall else 0,
+        "p50_s": round(md.percentile(latencies, 50), 3),
+        "p95_s": round(md.percentile(latencies, 95), 3),
+        "p99_s": round(md.percentile(latencies, 99), 3),
+        "cpu_s": round(cpu, 3),
+        "peak_rss_kb": peak_rss_kb(),
+    }))
+
+# (metric, worse when, noise floor) for the regression check against a saved baseline
+PIPELINE_CHECKS = [("tracks_per_s", "lower", 0.5), ("p95_s", "higher", 0.05), ("cpu_s", "higher", 0.1), ("peak_rss_kb", "higher", 5 * 1024)]
+
+def pipeline_regressions(results, baseline, tolerance):
+    previous = {(r["scenario"], r["threads"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = previous.get((r["scenario"], r["threads"]))
+        if not b: continue
+        for metric, worse, floor in PIPELINE_CHECKS:
+            old, new = b.get(metric), r.get(metric)
+            if old is None or new is None or abs(new - old) < floor: continue
+            if (worse == "lower" and new < old * (1 - tolerance)) or (worse == "higher" and new > old * (1 + tolerance)):
+                regressions.append(f"{r['scenario']} x{r['threads']}: {metric} {old} -> {new}")
+    return regressions
+
+def run_pipeline_scenarios(args, scenarios):
+    # every (scenario, url) at every --threads value, each in a fresh process against one fake backend
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_path = Path(work_dir)
+        FakeYTMusic.fixtures = args.fixtures
+        FakeYTMusic.track_seconds = args.seconds
+        FakeYTMusic.cover = make_cover(work_path / "cover.jpg", args.cover_size).read_bytes()
+        audio = make_audio(work_path / "track.m4a", args.seconds) if shutil.which("ffmpeg") else None
+        if audio is None:
+            audio = work_path / "track.m4a"
+            audio.write_bytes(os.urandom(args.seconds * 16 * 1024))
+        ffmpeg_dir = str(make_fake_ffmpeg(work_path)) if args.fake_ffmpeg or not shutil.which("ffmpeg") else None
+        server = start_server(FakeYTMusic)
+        api = f"http://127.0.0.1:{server.server_address[1]}"
+
+        results = []
+        for scenario, url in scenarios:
+            for threads in args.threads:
+                cmd = [sys.executable, __file__, "_pipeline", url, "--api", api, "--audio", str(audio), "--threads", str(threads), "--latency", str(args.latency), "--format", args.format]
+                if ffmpeg_dir: cmd += ["--ffmpeg-dir", ffmpeg_dir]
+                out = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+                if out.returncode != 0:
+                    print(f"{scenario} x{threads}: failed\n{out.stderr}")
+                    continue
+                results.append({"scenario": scenario, "threads": threads, **json.loads(out.stdout.strip().splitlines()[-1])})
+        server.shutdown()
+    return results
+
+def bench_pipeline(args):
+    scenarios = [(url.split("list=")[-1].split("&")[0], url) for url in args.urls] if args.urls else [(f"{kind}-{tracks}", pipeline_url(kind, tracks)) for kind in args.kinds for tracks in args.tracks]
+    results = run_pipeline_scenarios(args, scenarios)
+
+    print(f"{'scenario':<16}{'threads':>8}{'done':>8}{'tracks/s':>10}{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}{'cpu s':>8}{'rss MB':>8}")
+    for r in results:
+        rss = f"{r['peak_rss_kb'] / 1024:.1f}" if r["peak_rss_kb"] else "n/a"
+        print(f"{r['scenario'][:15]:<16}{r['threads']:>8}{r['done']:>5}/{r['tracks']:<2}{r['tracks_per_s']:>10}{r['p50_s']:>8}{r['p95_s']:>8}{r['p99_s']:>8}{r['cpu_s']:>8}{rss:>8}")
+    if args.save: Path(args.save).write_text(json.dumps(results, indent=1))
+    failed = [f"{r['scenario']} x{r['threads']}: {r['done']}/{r['tracks']} tracks" for r in results if r["done"] < r["tracks"]]
+    if len(results) < len(scenarios) * len(args.threads): failed.append("some scenarios did not run")
+    if args.baseline: failed += pipeline_regressions(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+    if failed: sys.exit("pipeline regression:\n   " + "\n   ".join(failed))
+    return results
+
+def bench_memory(args):
+    # peak rss of whole playlist runs at growing sizes; covers, track records and logging must not grow with the list
+    args.fixtures = None
+    results = run_pipeline_scenarios(args, [(f"playlist-{tracks}", pipeline_url("playlist", tracks)) for tracks in args.tracks])
+
+    print(f"{'scenario':<16}{'done':>12}{'wall s':>10}{'rss MB':>10}")
+    for r in results:
+        rss = f"{r['peak_rss_kb'] / 1024:.1f}" if r["peak_rss_kb"] else "n/a"
+        print(f"{r['scenario']:<16}{r['done']:>6}/{r['tracks']:<5}{r['wall_s']:>10}{rss:>10}")
+    if len(results) < len(args.tracks) or any(r["done"] < r["tracks"] for r in results): sys.exit("memory: some scenarios failed")
+    rss = [r["peak_rss_kb"] for r in results if r["peak_rss_kb"]]
+    if len(rss) < 2: return results
+    growth = (rss[-1] - rss[0]) / 1024
+    print(f"growth {growth:.1f} MB from {results[0]['tracks']} to {results[-1]['tracks']} tracks")
+    if growth > args.max_growth_mb: sys.exit(f"memory regression: peak rss grew {growth:.1f} MB (limit {args.max_growth_mb} MB)")
+    return results
+
+def record_fixtures(args):
+    # saves live ytmusicapi responses in the layout FakeYTMusic serves, so pipeline runs can replay real albums and playlists
+    import re
+    from ytmusicapi import YTMusic
+    yt = YTMusic()
+    root = Path(args.fixtures)
+
+    def save(method, key, data):
+        (root / method).mkdir(parents=True, exist_ok=True)
+        (root / method / f"{key}.json").write_text(json.dumps(data), encoding="utf-8")
+        return data
+
+    for url in args.urls:
+        olak, mpre, playlist = (re.search(rf'list=({prefix}[^&]+)', url) for prefix in ("OLAK5uy_", "MPREb_", "PL"))
+        if olak:
+            album_id = save("get_album_browse_id", olak.group(1), yt.get_album_browse_id(olak.group(1)))
+            save("get_album", album_id, yt.get_album(album_id))
+        elif mpre:
+            save("get_album", mpre.group(1), yt.get_album(mpre.group(1)))
+        elif playlist:
+            data = save("get_playlist", playlist.group(1), yt.get_playlist(playlist.group(1), limit=None))
+            for album_id in {t["album"]["id"] for t in data["tracks"] if t.get("album")}:
+                save("get_album", album_id, yt.get_album(album_id))
+        else:
+            print(f"Skipping {url}: not an album or playlist")
+            continue
+        print(f"Recorded {url}")
+
+# modules a headless run must not pay for at import time
+HEAVY_MODULES = ["PySide6", "PIL", "ytmusicapi", "yt_dlp", "requests", "mutagen"]
+
+def bench_startup(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    probe = f"import sys; import MusicDownloader; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    commands = {
+        "import": [sys.executable, "-c", probe],
+        "cli --help": [sys.executable, os.path.join(here, "MusicDownloader.py"), "--help"],
+    }
+    results = []
+    for name, cmd in commands.items():
+        times = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            out = subprocess.run(cmd, capture_output=True, text=True, cwd=here)
+            times.append((time.perf_counter() - start) * 1000)
+            if out.returncode != 0: sys.exit(f"{name}: failed\n{out.stderr}")
+        loaded = out.stdout.strip() if name == "import" else ""
+        results.append({"name": name, "median_ms": round(statistics.median(times), 1), "min_ms": round(min(times), 1), "heavy": loaded.split(",") if loaded else []})
+
+    print(f"{'startup':<14}{'median ms':>12}{'min ms':>10}  heavy modules loaded")
+    for r in results:
+        print(f"{r['name']:<14}{r['median_ms']:>12}{r['min_ms']:>10}  {', '.join(r['heavy']) or '-'}")
+    failed = [r for r in results if r["heavy"] or (args.max_ms and r["median_ms"] > args.max_ms)]
+    if failed: sys.exit(f"startup regression: {', '.join(r['name'] for r in failed)}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="MusicDownloader benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("engines", help="Compare download engines against a local fake extractor")
+    p.add_argument("--engines", nargs="+", default=["library", "subprocess"])
+    p.add_argument("--tracks", type=int, default=20)
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--seconds", type=int, default=30, help="Length of the generated audio")
+    p.add_argument("--latency", type=float, default=0.0, help="Seconds of latency added per request")
+    p.set_defaults(func=bench_engines)
+
+    p = sub.add_parser("formats", help="CPU seconds per album for the mp3 re-encode vs the native remux")
+    p.add_argument("--formats", nargs="+", default=["mp3", "native"])
+    p.add_argument("--tracks", type=int, default=12, help="Tracks per album")
+    p.add_argument("--seconds", type=int, default=180, help="Length of each generated track")
+    p.set_defaults(func=bench_formats)
+
+    p = sub.add_parser("startup", help="Import and CLI start time, fails if a heavy module is imported eagerly or --max-ms is exceeded")
+    p.add_argument("--runs", type=int, default=10)
+    p.add_argument("--max-ms", type=float, help="Fail when the median start time exceeds this")
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("pipeline", help="End to end album and playlist runs against a local fake YouTube Music and a stub downloader")
+    p.add_argument("--kinds", nargs="+", default=["album", "playlist"], choices=["album", "playlist"])
+    p.add_argument("--tracks", type=int, nargs="+", default=[10, 50])
+    p.add_argument("--threads", type=int, nargs="+", default=[2, 8], help="max_threads values to run each scenario with")
+    p.add_argument("--urls", nargs="+", help="Run these (recorded) URLs instead of the synthetic kinds")
+    p.add_argument("--fixtures", help="Directory of recorded responses, see record")
+    p.add_argument("--seconds", type=int, default=30, help="Length of the stub audio")
+    p.add_argument("--latency", type=float, default=0.05, help="Seconds the stub downloader waits before each track")
+    p.add_argument("--cover-size", type=int, default=1200, help="Width and height of the served cover")
+    p.add_argument("--format", default="mp3", choices=["mp3", "native"])
+    p.add_argument("--fake-ffmpeg", action="store_true", help="Copy instead of running ffmpeg (used anyway when ffmpeg is missing)")
+    p.add_argument("--save", help="Write the results as JSON, for use as a later --baseline")
+    p.add_argument("--baseline", help="Fail when a result regresses past --tolerance against this saved run")
+    p.add_argument("--tolerance", type=float, default=0.25)
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser("memory", help="Peak RSS of playlist runs as the playlist grows, fails if it isn't flat")
+    p.add_argument("--tracks", type=int, nargs="+", default=[100, 1000, 5000], help="Playlist sizes, smallest first")
+    p.add_argument("--threads", type=int, nargs="+", default=[8])
+    p.add_argument("--seconds", type=int, default=1, help="Length of the stub audio")
+    p.add_argument("--latency", type=float, default=0.0)
+    p.add_argument("--cover-size", type=int, default=800, help="Served cover size; 800 gives about 400 KB, what a 1200px cover usually weighs")
+    p.add_argument("--format", default="native", choices=["mp3", "native"])
+    p.add_argument("--fake-ffmpeg", action="store_true", default=True, help=argparse.SUPPRESS)
+    p.add_argument("--max-growth-mb", type=float, default=30.0)
+    p.set_defaults(func=bench_memory)
+
+    p = sub.add_parser("record", help="Record live YouTube Music responses as pipeline fixtures")
+    p.add_argument("urls", nargs="+")
+    p.add_argument("--fixtures", required=True)
+    p.set_defaults(func=record_fixtures)
+
+    p = sub.add_parser("_pipeline")
+    p.add_argument("url")
+    p.add_argument("--api", required=True)
+    p.add_argument("--audio", required=True)
+    p.add_argument("--threads", type=int, default=4)
+    p.add_argument("--latency", type=float, default=0.0)
+    p.add_argument("--format", default="mp3")
+    p.add_argument("--ffmpeg-dir")
+    p.set_defaults(func=run_pipeline)
+
+    p = sub.add_parser("_engine")
+    p.add_argument("engine")
+    p.add_argument("--url-base", required=True)
+    p.add_argument("--tracks", type=int, default=20)
+    p.add_argument("--threads", type=int, default=8)
+    p.set_defaults(func=run_engine)
+
+    args = parser.parse_args()
+    args.func(args)
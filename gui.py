@@ -0,0 +1,421 @@
+import asyncio
+import ctypes
+import os
+import sys
+import threading
+
+from PySide6.QtWidgets import (QApplication, QWidget, QLabel, QLineEdit, QPushButton, QVBoxLayout, QFormLayout, QHBoxLayout, QTextEdit, QPlainTextEdit, QFileDialog, QSpinBox, QProgressBar, QComboBox)
+from PySide6.QtGui import QPixmap, QFont, QIcon
+from PySide6.QtCore import Qt, QObject, QTimer, Signal
+
+from MusicDownloader import (Logger, LogBuffer, JobControl, LOG_INFO, LOG_ERROR, LOG_LEVELS, parse_log_level, format_progress,
+    get_album_cover, get_album_cover_thumbnail, scrape_job, run_url, run_batch, read_urls, daemon_running, daemon_request)
+
+class EventLoopThread():
+    # the gui's one asyncio loop, running on its own thread. qt hands it coroutines and hears back through signals,
+    # which qt queues onto the gui thread because they are emitted from this one
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, func, *args):
+        self.loop.call_soon_threadsafe(func, *args)
+
+def merge_progress(snapshots, paused):
+    # several daemon jobs as one JobControl.snapshot
+    merged = {"done_bytes": 0, "total_bytes": 0, "tracks_done": 0, "tracks": 0, "albums": {}, "active": [], "paused": paused}
+    for snapshot in snapshots:
+        for key in ("done_bytes", "total_bytes", "tracks_done", "tracks"): merged[key] += snapshot[key]
+        merged["albums"].update(snapshot["albums"])
+        merged["active"] += snapshot["active"]
+    return merged
+
+class Worker(QObject):
+    finished_signal = Signal()
+    data_signal = Signal(dict, bytes)
+    progress_signal = Signal(dict)
+
+    def __init__(self, urls, config, loop : EventLoopThread, logger : Logger = Logger(), data_only = False):
+        super().__init__()
+        self.urls = [urls] if isinstance(urls, str) else list(urls)
+        self.config = config
+        self.loop = loop
+        self.logger = logger
+        self.data_only = data_only
+        self.task = None
+        self.cancelled = False
+        self.remote = False
+        self.control = JobControl(on_progress=self.progress_signal.emit)
+
+    def start(self):
+        self.loop.call(self.create_task)
+
+    def create_task(self):
+        # finished goes out from the task's own completion, so only once teardown (children killed, journal closed) is done
+        self.task = asyncio.ensure_future(self.run())
+        self.task.add_done_callback(lambda task: self.finished_signal.emit())
+
+    def cancel(self):
+        # cancelling the task kills in-flight children; finished tracks and partial downloads stay for the next run
+        self.cancelled = True
+        self.control.resume()
+        self.loop.call(self.cancel_task)
+
+    def cancel_task(self):
+        # daemon jobs are deleted by run_remote, which then follows them until the daemon has wound them down
+        if self.task and not self.remote: self.task.cancel()
+
+    def pause(self, paused = True):
+        if paused: self.control.pause()
+        else: self.control.resume()
+
+    async def emit_data(self, data, logger : Logger = Logger()):
+        await get_album_cover(data["cover"], logger=logger, config=self.config)
+        thumbnail = get_album_cover_thumbnail(data["cover"], config=self.config)
+        self.data_signal.emit(data, thumbnail if thumbnail else b'')
+
+    async def run(self):
+        logger = self.logger
+        on_data = lambda data: self.emit_data(data, logger)
+        try:
+            if self.data_only:
+                data, telemetry = await scrape_job(self.urls[0], self.config, logger)
+                if telemetry: telemetry.close(Logger(None))
+                if data: await on_data(data)
+            elif self.config["gui_daemon"] and await asyncio.to_thread(daemon_running, self.config):
+                await self.run_remote(logger)
+            elif len(self.urls) > 1:
+                await run_batch(self.urls, self.config, logger=logger, on_data=on_data, control=self.control)
+            else:
+                await run_url(self.urls[0], self.config, logger, on_data=on_data, control=self.control)
+        except Exception as e:
+            logger.out(f"Error: {e}", LOG_ERROR)
+
+    async def remote_call(self, method, path, body = None):
+        return await asyncio.to_thread(daemon_request, self.config, method, path, body)
+
+    async def run_remote(self, logger : Logger):
+        # with a daemon running the gui is only its client: the jobs run there, on its warm caches, pools and bandwidth
+        # budget, and outlive the window. temp, cover and thread settings are the daemon's own; out_dir has to be inside its one
+        self.remote = True
+        logger.out("Daemon running, handing the downloads to it")
+        jobs = []
+        for url in self.urls:
+            if self.cancelled: break
+            job = await self.remote_call("POST", "/jobs", {"url": url, "options": {"out_dir": self.config["out_dir"]}})
+            logger.out(f"Job {job['id']} [{job['status']}]: {job['url']}")
+            jobs.append(job)
+        since = {job["id"]: 0 for job in jobs}
+        shown = set()
+        paused = deleted = False
+        while jobs:
+            # stop and pause reach the daemon on the next poll
+            if self.cancelled and not deleted:
+                deleted = True
+                for job_id in since: await self.remote_call("DELETE", f"/jobs/{job_id}")
+            elif self.control.paused != paused:
+                paused = self.control.paused
+                for job_id in since: await self.remote_call("PATCH", f"/jobs/{job_id}", {"paused": paused})
+            jobs = []
+            for job_id in since:
+                job = await self.remote_call("GET", f"/jobs/{job_id}?since={since[job_id]}")
+                for line in job["log"]: logger.out(line)
+                since[job_id] = job["log_next"]
+                if job["info"] and job_id not in shown:
+                    shown.add(job_id)
+                    await self.emit_data(job["info"], logger)
+                jobs.append(job)
+            self.progress_signal.emit(merge_progress([job["progress"] for job in jobs], paused))
+            if all(job["status"] not in ("queued", "running") for job in jobs): break
+            await asyncio.sleep(0.5)
+        for job in jobs:
+            result = job["result"] or {}
+            logger.out(f"[{job['status']}] {job['title'] or job['url']}: {result.get('done', 0)}/{result.get('tracks', 0)} downloaded, {result.get('skipped', 0)} skipped, {result.get('failed', 0)} failed", LOG_ERROR if job["error"] else LOG_INFO)
+
+class MusicDownloaderGUI(QWidget):
+    def __init__(self, config):
+        super().__init__()
+        self.setWindowTitle("Music Downloader")
+        self.resize(900,600)
+
+        self.config = config
+        self.loop = EventLoopThread()
+        self.log_buffer = LogBuffer(config["console_max_lines"], parse_log_level(config["log_level"]))
+        self.setup_ui()
+
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start(100)
+
+    def setup_ui(self):
+        main_layout = QHBoxLayout(self)
+
+        left_widget = QWidget()
+        left_layout = QVBoxLayout(left_widget)
+        left_layout.setContentsMargins(0, 0, 0, 0)
+
+        form_layout = QFormLayout()
+
+        #url
+        self.url_input = QPlainTextEdit()
+        self.url_input.setPlaceholderText("Paste URL here, or several URLs one per line...")
+        self.url_input.setFixedHeight(60)
+        self.btn_fetch_data = QPushButton("Fetch Data")
+        self.btn_fetch_data.setFixedWidth(80)
+        self.btn_fetch_data.clicked.connect(lambda: self.fetch_data())
+        url_layout = QHBoxLayout()
+        url_layout.addWidget(self.url_input)
+        url_layout.addWidget(self.btn_fetch_data, 0, Qt.AlignTop)
+        form_layout.addRow("URL:", url_layout)
+
+        #out path
+        self.out_input = QLineEdit(self.config["out_dir"])
+        self.btn_browse_out = QPushButton("...")
+        self.btn_browse_out.setFixedWidth(30)
+        self.btn_browse_out.clicked.connect(lambda: self.browse_folder(self.out_input))
+        out_layout = QHBoxLayout()
+        out_layout.addWidget(self.out_input)
+        out_layout.addWidget(self.btn_browse_out)
+        form_layout.addRow("Output Path:", out_layout)
+
+        #temp path
+        self.temp_input = QLineEdit(self.config["temp_dir"])
+        self.btn_browse_temp = QPushButton("...")
+        self.btn_browse_temp.setFixedWidth(30)
+        self.btn_browse_temp.clicked.connect(lambda: self.browse_folder(self.temp_input))
+        temp_layout = QHBoxLayout()
+        temp_layout.addWidget(self.temp_input)
+        temp_layout.addWidget(self.btn_browse_temp)
+        form_layout.addRow("Temp Path:", temp_layout)
+
+        #cover path
+        self.cover_input = QLineEdit(self.config["cover_dir"])
+        self.btn_browse_cover = QPushButton("...")
+        self.btn_browse_cover.setFixedWidth(30)
+        self.btn_browse_cover.clicked.connect(lambda: self.browse_folder(self.cover_input))
+        cover_layout = QHBoxLayout()
+        cover_layout.addWidget(self.cover_input)
+        cover_layout.addWidget(self.btn_browse_cover)
+        form_layout.addRow("Cover Path:", cover_layout)
+
+        #threads
+        self.num_threads_input = QSpinBox()
+        self.num_threads_input.setRange(1, 128)
+        self.num_threads_input.setValue(int(self.config.get("max_threads", 4)))
+        self.num_threads_input.setFixedWidth(100)
+        form_layout.addRow("Max Threads:", self.num_threads_input)
+
+        left_layout.addLayout(form_layout)
+
+        #start button
+        self.start_btn = QPushButton("Start Download")
+        self.start_btn.setMinimumHeight(40)
+        self.start_btn.clicked.connect(self.start_process)
+        left_layout.addWidget(self.start_btn)
+
+        #pause / stop
+        self.pause_btn = QPushButton("Pause")
+        self.pause_btn.setEnabled(False)
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        self.stop_btn = QPushButton("Stop")
+        self.stop_btn.setEnabled(False)
+        self.stop_btn.clicked.connect(self.stop_process)
+        control_layout = QHBoxLayout()
+        control_layout.addWidget(self.pause_btn)
+        control_layout.addWidget(self.stop_btn)
+        left_layout.addLayout(control_layout)
+
+        #progress
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1000)
+        self.progress_bar.setTextVisible(False)
+        left_layout.addWidget(self.progress_bar)
+        self.progress_label = QLabel("")
+        left_layout.addWidget(self.progress_label)
+
+        #console
+        self.console_label = QLabel("Console Output:")
+        self.log_level_input = QComboBox()
+        for name, level in LOG_LEVELS.items():
+            self.log_level_input.addItem(name.capitalize(), level)
+        self.log_level_input.setCurrentIndex(max(0, self.log_level_input.findData(self.log_buffer.level)))
+        self.log_level_input.currentIndexChanged.connect(lambda: setattr(self.log_buffer, "level", self.log_level_input.currentData()))
+        console_layout = QHBoxLayout()
+        console_layout.addWidget(self.console_label)
+        console_layout.addStretch()
+        console_layout.addWidget(self.log_level_input)
+        left_layout.addLayout(console_layout)
+        self.console = QPlainTextEdit()
+        self.console.setReadOnly(True)
+        self.console.setMaximumBlockCount(self.config["console_max_lines"])
+        self.console.setStyleSheet("background-color: #222; color: #EEE; font-family: Consolas, monospace;")
+        left_layout.addWidget(self.console)
+
+        right_widget = QWidget()
+        right_widget.setFixedWidth(320)
+        right_layout = QVBoxLayout(right_widget)
+        right_layout.setContentsMargins(10, 0, 0, 0)
+
+        #cover image
+        self.cover_label = QLabel()
+        self.cover_label.setFixedSize(300, 300)
+        self.cover_label.setStyleSheet("background-color: #333; border: 1px solid #555;")
+        self.cover_label.setAlignment(Qt.AlignCenter)
+        self.cover_label.setText("No Cover")
+        right_layout.addWidget(self.cover_label)
+
+        self.info_console = QTextEdit()
+        self.info_console.setReadOnly(True)
+        self.info_console.setStyleSheet("background-color: #222; color: #EEE; font-family: Consolas, monospace;")
+        self.info_console.setFixedWidth(300)
+        right_layout.addWidget(self.info_console, 1)
+        
+        right_layout.addStretch()
+
+        main_layout.addWidget(left_widget, 1) 
+        main_layout.addWidget(right_widget, 0)
+
+    def browse_folder(self, line_edit):
+        folder = QFileDialog.getExistingDirectory(self, "Select Directory", line_edit.text())
+        if folder:
+            line_edit.setText(folder)
+
+    def log_to_console(self, text, level = LOG_INFO):
+        self.log_buffer.out(text, level)
+
+    def flush_log(self):
+        lines, dropped = self.log_buffer.drain()
+        if not lines: return
+        if dropped: lines.insert(0, f"... {dropped} lines skipped")
+        self.console.appendPlainText("\n".join(lines))
+        sb = self.console.verticalScrollBar()
+        sb.setValue(sb.maximum())
+
+    def update_info_panel(self, data, thumbnail):
+        style_key = "font-weight: bold; color: #FFD700;" 
+        style_val = "color: #FFFFFF;"
+        
+        track_list_html = "<br>".join(
+            f"<span style='font-weight: bold; color: #FFFFFF;'>{track['trackNumber']}. </span>"
+            f"<span style='color: #FFFFFF;'>{track['title']}</span>"
+            for track in data["tracks"]
+    ) if data["type"] != "playlist" else "<br>".join(
+            f"<span style='color: #FFFFFF;'>{track['title']}</span>"
+            for track in data["tracks"]
+    )
+
+        indented_tracks = f"<div style='margin-left: 1em;'>{track_list_html}</div>"
+
+        info_text = (
+            f"<span style='{style_key}'>Title:</span> <span style='{style_val}'>{data.get('title', 'Unknown')}</span><br>"
+            f"<span style='{style_key}'>Artist:</span> <span style='{style_val}'>{data.get('artist', 'Unknown')}</span><br>"
+            f"<span style='{style_key}'>Year:</span> <span style='{style_val}'>{data.get('year', 'Unknown')}</span><br>"
+            f"<span style='{style_key}'>Type:</span> <span style='{style_val}'>{data.get('type', 'Unknown').capitalize()}</span><br>"
+            f"<span style='{style_key}'>Tracks:</span> <span style='{style_val}'>{data.get('trackcount', 0)}</span>"
+            f"{indented_tracks}"
+        )
+        
+        self.info_console.setHtml(info_text)
+        sb = self.console.verticalScrollBar()
+        sb.setValue(sb.minimum())
+
+        if thumbnail:
+            pixmap = QPixmap()
+            pixmap.loadFromData(thumbnail)
+            self.cover_label.setPixmap(pixmap)
+        else:
+            self.cover_label.setText("No Cover Found")
+    
+    def update_progress(self, snapshot):
+        total = snapshot["total_bytes"]
+        self.progress_bar.setValue(int(snapshot["done_bytes"] * 1000 / total) if total else 0)
+        lines = [format_progress(snapshot)]
+        for album, a in snapshot["albums"].items():
+            if a["tracks_done"] < a["tracks"]:
+                lines.append(f"   {album}: {a['tracks_done']}/{a['tracks']} tracks, {a['done_bytes'] * 100 // max(a['total_bytes'], 1)}%")
+        self.progress_label.setText("\n".join(lines[:4]))
+
+    def toggle_pause(self):
+        paused = not self.worker.control.paused
+        self.worker.pause(paused)
+        self.pause_btn.setText("Resume" if paused else "Pause")
+        self.log_to_console("Paused, downloads in progress will finish..." if paused else "Resumed")
+
+    def stop_process(self):
+        self.stop_btn.setEnabled(False)
+        self.pause_btn.setEnabled(False)
+        self.log_to_console("Stopping...")
+        self.worker.cancel()
+
+    def fetch_data(self):
+        urls = read_urls(self.url_input.toPlainText().splitlines())
+        if not urls:
+            self.log_to_console("Error: Please enter a URL.", LOG_ERROR)
+            return
+        
+        self.btn_fetch_data.setEnabled(False)
+        self.log_buffer.clear()
+        self.console.clear()
+        
+        self.worker = Worker(urls[0], self.config, self.loop, self.log_buffer, data_only=True)
+        self.worker.data_signal.connect(self.update_info_panel)
+        self.worker.finished_signal.connect(self.on_finished)
+        self.worker.start()
+
+    def start_process(self):
+        urls = read_urls(self.url_input.toPlainText().splitlines())
+        if not urls:
+            self.log_to_console("Error: Please enter a URL.", LOG_ERROR)
+            return
+
+        config = self.config.copy()
+        config["out_dir"] = self.out_input.text()
+        config["temp_dir"] = self.temp_input.text()
+        config["cover_dir"] = self.cover_input.text()
+        config["max_threads"] = self.num_threads_input.value()
+
+        self.btn_fetch_data.setEnabled(False)
+
+        self.start_btn.setEnabled(False)
+        self.start_btn.setText("Downloading...")
+        self.log_buffer.clear()
+        self.console.clear()
+
+        self.cover_label.clear()
+        self.cover_label.setText("Loading...")
+
+        self.progress_bar.setValue(0)
+        self.progress_label.setText("")
+        self.pause_btn.setText("Pause")
+        self.pause_btn.setEnabled(True)
+        self.stop_btn.setEnabled(True)
+
+        self.worker = Worker(urls, config, self.loop, self.log_buffer)
+        self.worker.data_signal.connect(self.update_info_panel)
+        self.worker.progress_signal.connect(self.update_progress)
+        self.worker.finished_signal.connect(self.on_finished)
+        self.worker.start()
+
+    def on_finished(self):
+        self.btn_fetch_data.setEnabled(True)
+        self.start_btn.setEnabled(True)
+        self.start_btn.setText("Start Download")
+        self.pause_btn.setText("Pause")
+        self.pause_btn.setEnabled(False)
+        self.stop_btn.setEnabled(False)
+        if self.worker.cancelled: self.log_to_console("Stopped, run again to resume")
+
+def run_gui(config):
+    if os.name == 'nt':
+        myappid = 'music.downloader.gui.v1'
+        ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
+    app = QApplication(sys.argv)
+    if os.path.exists("MusicDownloader.ico"):
+        app.setWindowIcon(QIcon("MusicDownloader.ico"))
+    window = MusicDownloaderGUI(config)
+    window.show()
+    return app.exec()